@@ -1,22 +1,24 @@
 import asyncio
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from livekit import agents
 from livekit.agents import AgentSession, Agent, RoomInputOptions
-from livekit.plugins import noise_cancellation, silero
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
+from livekit.plugins import noise_cancellation
 from livekit.rtc import ConnectionState
 import dateparser
 from chroma.chroma_service import ChromaService
 import re
-from db.mongo_service import MongoService
+from db.async_mongo_service import AsyncMongoService
+from db.availability import LOCAL_TZ, localize
 from models.user import User
+from notifications.notification_client import NotificationClient
+from utils.prewarm import prewarm_voice_models, timed
+from utils.room_utils import wait_for_participant
+from utils.timing import PhaseTimer
 from utils.time_utils import format_datetime_natural
 
 load_dotenv(".env.local")
 
-chroma_service = ChromaService()
-mongo_service = MongoService()
-
 # --- Helper: simple text → list of symptoms --- #
 def extract_symptoms(text: str) -> list[str]:
     """
@@ -38,10 +40,27 @@ async def parse_datetime(ctx: agents.RunContext, text: str) -> dict:
         return {"error": "Could not parse date/time."}
     return {"datetime": parsed.isoformat()}
 
+# Free times read back to the caller at once; more than this is hard to follow by voice
+MAX_OFFERED_SLOTS = 6
+
+
+def local_day(value: datetime) -> datetime:
+    """Clinic-local midnight starting the day of `value` (naive values are clinic-local)."""
+    return LOCAL_TZ.localize(datetime.combine(localize(value).date(), datetime.min.time()))
+
+
+def offered_times(slots: list[datetime]) -> list[str]:
+    """Clinic-local free times, in the naive ISO form book_appointment takes."""
+    return [slot.strftime("%Y-%m-%dT%H:%M:%S") for slot in slots]
+
+
 # --- Define main Assistant agent --- #
 class MainAssistant(Agent):
-    def __init__(self, user: User | None) -> None:
+    def __init__(self, user: User | None, chroma_service: ChromaService, mongo_service: AsyncMongoService,
+                 notification_client: NotificationClient) -> None:
         self.user = user
+        # Set by the entrypoint while the user lookup is still running
+        self.user_attached: asyncio.Task | None = None
         self.issue = ""
         self.symptoms = []
         self.recommendations = []
@@ -98,17 +117,20 @@ class MainAssistant(Agent):
         
         @agents.function_tool
         async def book_appointment(ctx: agents.RunContext, issue: str, preferred_time: str) -> dict:
+            # The booking (and the confirmation email) needs the user, however slow the lookup
+            if self.user_attached:
+                await self.user_attached
             user_id = str(self.user._id) if self.user else "anonymous"
             rebooking = False
 
             # --- Handle rebooking ---
             if self.appointment_id:
                 print(f"🔄 Deleting previous appointment {self.appointment_id} for rebooking...")
-                mongo_service.delete_appointment(self.appointment_id)
+                await mongo_service.delete_appointment(self.appointment_id)
                 rebooking = True
 
             print(f"📅 Booking appointment for {user_id} regarding {issue} at {preferred_time}")
-            result = mongo_service.create_appointment(
+            result = await mongo_service.create_appointment(
                 user_id=user_id,
                 issue=f"Appointment regarding {issue}",
                 datetime_iso=preferred_time,
@@ -116,7 +138,13 @@ class MainAssistant(Agent):
             )
 
             if not result:
-                return {"confirmation": "There was a scheduling conflict. Please choose a different time."}
+                # Offer the free times of that day right away instead of letting the user guess
+                day = local_day(datetime.fromisoformat(preferred_time))
+                slots = await mongo_service.find_free_slots(max(day, datetime.now(LOCAL_TZ)), day + timedelta(days=1), limit=MAX_OFFERED_SLOTS)
+                return {
+                    "confirmation": "There was a scheduling conflict. Please choose a different time.",
+                    "available_times": offered_times(slots),
+                }
 
             self.appointment_id = result
 
@@ -141,17 +169,9 @@ class MainAssistant(Agent):
                         "- Cura Healthcare Team"
                     )
 
-                    email_payload = {"email": self.user.email, "subject": subject, "content": content}
-
                     try:
-                        import aiohttp
-                        async with aiohttp.ClientSession() as session:
-                            await session.post(
-                                "https://healthcare-ai-backend-s5rf.onrender.com/email",
-                                json=email_payload,
-                                timeout=aiohttp.ClientTimeout(total=10)
-                            )
-                        print(f"📧 Email {'update' if rebooking else 'confirmation'} sent to {self.user.email}")
+                        message_id = await notification_client.send_email(self.user.email, subject, content)
+                        print(f"📧 Email {'update' if rebooking else 'confirmation'} queued for {self.user.email} ({message_id})")
                     except Exception as e:
                         print(f"⚠️ Failed to send {'update' if rebooking else 'confirmation'} email: {e}")
 
@@ -159,6 +179,28 @@ class MainAssistant(Agent):
                 asyncio.create_task(send_email())
             return {"confirmation": f"Appointment booked successfully for {preferred_time}"}
         
+        @agents.function_tool
+        async def check_availability(ctx: agents.RunContext, day: str = "") -> dict:
+            """
+            Lists the times the doctor is free for a one-hour appointment.
+            `day` is a natural language or ISO date ("tomorrow", "next Monday", "2025-10-24");
+            leave it empty to search the coming week.
+            """
+            # The clinic's clock, not the worker host's (usually UTC)
+            now = datetime.now(LOCAL_TZ)
+            if day:
+                parsed = dateparser.parse(day, settings={"PREFER_DATES_FROM": "future", "RELATIVE_BASE": now.replace(tzinfo=None)})
+                if not parsed:
+                    return {"error": "Could not parse the day."}
+                start = local_day(parsed)
+                end = start + timedelta(days=1)
+            else:
+                start, end = now, now + timedelta(days=7)
+            slots = await mongo_service.find_free_slots(max(start, now), end, limit=MAX_OFFERED_SLOTS)
+            if not slots:
+                return {"available_times": [], "message": "The doctor has no free time then."}
+            return {"available_times": offered_times(slots)}
+
         super().__init__(
             instructions=(
                 "You are a friendly healthcare assistant. "
@@ -174,8 +216,9 @@ class MainAssistant(Agent):
                 "then call the `parse_datetime` tool to get the absolute timestamp. "
                 "Confirm this time with the user in natural language before booking. "
                 "After confirmation, call `book_appointment` with the ISO datetime and the user's id."
-                "If `book_appointment` return conflict schedule, inform the user that there was a scheduling conflict and ask if they're available at a different time."
-                "Then, try booking again."
+                "If the user asks when the doctor is free, or isn't sure when to come, call `check_availability` and offer a few of the `available_times`. "
+                "If `book_appointment` return conflict schedule, inform the user that there was a scheduling conflict and offer some of the `available_times` it returned. "
+                "Then, try booking again with the time the user picks."
 
                 "Example:"
                 "Assistant: How are you feeling today?"
@@ -194,7 +237,7 @@ class MainAssistant(Agent):
                 "Assistant: (call `book_appointment` with the ISO datetime and user's id)"
                 "Assistant: 'Your appointment has been booked successfully.'"
             ),
-            tools=[symptom_check_api, book_appointment, parse_datetime]
+            tools=[symptom_check_api, book_appointment, check_availability, parse_datetime]
         )
 
     async def handle_input(self, user_input: str) -> None:
@@ -202,47 +245,81 @@ class MainAssistant(Agent):
         await self.session.generate_reply()
 
 
+# --- Prewarm: runs once per worker process, before any job --- #
+def prewarm(proc: agents.JobProcess):
+    prewarm_voice_models(proc)
+
+    def warm_symptom_index():
+        chroma_service = ChromaService()
+        # Loads the embedding model so the first symptom check doesn't pay for it
+        chroma_service.embed(["headache"])
+        return chroma_service
+
+    proc.userdata["chroma"] = timed("symptom index", warm_symptom_index)
+    proc.userdata["mongo"] = timed("Mongo client", AsyncMongoService)
+    proc.userdata["notifications"] = NotificationClient()
+
+
 # --- Entrypoint --- #
 async def entrypoint(ctx: agents.JobContext):
-    await ctx.connect()
+    chroma_service = ctx.proc.userdata["chroma"]
+    mongo_service = ctx.proc.userdata["mongo"]
+    notification_client = ctx.proc.userdata["notifications"]
+
+    timer = PhaseTimer(f"Call startup {ctx.job.id}")
+
+    # Open the Mongo pool while the room connects
+    mongo_warm = asyncio.create_task(mongo_service.warm())
+    # Confirmation emails still queued (or in flight) go out before the job process exits
+    ctx.add_shutdown_callback(notification_client.close)
+    await timer.measure("connect", ctx.connect())
     room = ctx.room
 
     print(f"Waiting for user to join room {room.name}...")
 
-    participant = None
-    for _ in range(15):
-        if room.remote_participants:
-            participant = next(iter(room.remote_participants.values()))
-            break
-        await asyncio.sleep(1)
+    participant = await timer.measure("wait_participant", wait_for_participant(room, timeout=15))
 
     if not participant:
+        await mongo_warm
         print("⚠️ No remote participants joined in time.")
         return
 
     user_identity = participant.identity
     print(f"✅ User {user_identity} {participant.name} joined.")
+    timer.begin("session_setup")
     identity = participant.identity
-    user = None
-
-    if identity.startswith("sip_"):
-        # Extract phone number after 'sip_'
-        phone_number = identity.split("sip_")[1]
-        user = mongo_service.fetch_user_by_phone(phone_number)
-    else:
-        user = mongo_service.fetch_user_by_id(identity)
 
-    print(f"Fetched user from DB: {user.name} ({user.email})")
+    async def lookup_user() -> User | None:
+        await mongo_warm
+        if identity.startswith("sip_"):
+            # Extract phone number after 'sip_'
+            phone_number = identity.split("sip_")[1]
+            return await mongo_service.fetch_user_by_phone(phone_number)
+        return await mongo_service.fetch_user_by_id(identity)
 
     session = AgentSession(
         stt="assemblyai/universal-streaming:en",  # or your STT model
         llm="openai/gpt-4.1-mini",  # or your chosen LLM
         tts="cartesia/sonic-2",  # or chosen TTS model
-        vad=silero.VAD.load(),
-        turn_detection=MultilingualModel()
+        vad=ctx.proc.userdata["vad"],
+        turn_detection=ctx.proc.userdata["turn_detection"]
     )
-    
-    agent = MainAssistant(user=user)
+
+    # The user is attached once the lookup returns; tools that need it wait for it
+    agent = MainAssistant(
+        user=None,
+        chroma_service=chroma_service,
+        mongo_service=mongo_service,
+        notification_client=notification_client,
+    )
+
+    async def attach_user():
+        agent.user = await timer.measure("user_lookup", lookup_user())
+        if agent.user:
+            print(f"Fetched user from DB: {agent.user.name} ({agent.user.email})")
+
+    user_attached = agent.user_attached = asyncio.create_task(attach_user())
+    timer.end("session_setup")
     
         # --- Cleanup helper --- #
     async def cleanup_session():
@@ -267,12 +344,14 @@ async def entrypoint(ctx: agents.JobContext):
         # Save conversation summary
         if agent.appointment_id:
             print(f"Saving conversation summary for appointment {agent.appointment_id}...")
-            mongo_service.save_conversation_summary(
-                user_id=str(user._id),
+            await user_attached
+            await mongo_service.save_conversation_summary(
+                user_id=str(agent.user._id) if agent.user else "anonymous",
                 issue=agent.issue,
                 symptoms=agent.symptoms,
                 recommendations=agent.recommendations,
                 appointment_id=agent.appointment_id,
+                idempotency_key=ctx.job.id,
             )
         
         # Cleanup
@@ -281,18 +360,23 @@ async def entrypoint(ctx: agents.JobContext):
     # Register the event handler
     room.on("participant_disconnected", lambda p: asyncio.create_task(on_participant_disconnected(p)))
 
-    await session.start(
+    # Session start runs while the user lookup is still in flight
+    await timer.measure("session_start", session.start(
         room=ctx.room,
         agent=agent,
         room_input_options=RoomInputOptions(
             noise_cancellation=noise_cancellation.BVC()
         )
-    )
+    ))
+    timer.checkpoint("time_to_greeting")
 
     await session.generate_reply(
         instructions="Greet the user that you are their healthcare assistant and ask how can you help them today."
     )
+    await user_attached
+    print(timer.summary())
+    print(f"👤 User cache: {mongo_service.user_cache.stats()}")
 
 
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, agent_name="my-telephony-agent"))
\ No newline at end of file
+    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm, agent_name="my-telephony-agent"))
\ No newline at end of file
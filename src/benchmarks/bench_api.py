@@ -0,0 +1,232 @@
+# bench_api.py
+# Load test of the FastAPI read endpoints against a local database seeded with the
+# synthetic generator: p50/p95/p99 latency, throughput and Mongo round-trips per
+# request for each endpoint, written as JSON so runs can be diffed between commits.
+# With --baseline, exits non-zero when an endpoint regressed past the tolerances.
+#   cd src && python -m benchmarks.bench_api --out bench_api.json
+#   cd src && python -m benchmarks.bench_api --skip-seed --baseline bench_api.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import aiohttp
+import uvicorn
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+from benchmarks.bench_doctor_calendar import CommandCounter
+from db.generate_data import generate
+from db.indexes import ensure_indexes
+
+load_dotenv(".env.local")
+
+ENDPOINTS = ["login", "calendar_user", "calendar_doctor", "conversations_user", "conversations"]
+
+
+def seed(db, users: int, appointments: int, doctors: int, seed_value: int, workers: int, mongo_url: str) -> dict:
+    for collection in ("users", "calendars", "conversations", "feedback"):
+        db[collection].drop()
+    stats = generate(db, users, appointments, doctors, seed_value, workers=workers, mongo_url=mongo_url)
+    ensure_indexes(db)
+    print(f"🌱 Seeded {stats['docs']} documents at {stats['docs_per_sec']:.0f} docs/sec")
+    return stats
+
+
+def sample_targets(db, size: int = 1000) -> dict:
+    """Ids and emails the requests are drawn from."""
+    patients = list(db.users.aggregate([{"$match": {"type": "patient"}}, {"$sample": {"size": size}},
+                                        {"$project": {"email": 1}}]))
+    appointments = list(db.calendars.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 1}}]))
+    return {
+        "emails": [user["email"] for user in patients],
+        "user_ids": [str(user["_id"]) for user in patients],
+        "doctor_ids": db.calendars.distinct("doctor_id"),
+        "appointment_ids": [str(appointment["_id"]) for appointment in appointments],
+    }
+
+
+def make_request(endpoint: str, targets: dict, rng: random.Random) -> tuple[str, str, dict]:
+    """(method, path, params or JSON body) of one request to `endpoint`."""
+    if endpoint == "login":
+        return "POST", "/login", {"email": rng.choice(targets["emails"])}
+    if endpoint == "calendar_user":
+        return "GET", "/calendar/user", {"id": rng.choice(targets["user_ids"])}
+    if endpoint == "calendar_doctor":
+        return "GET", "/calendar/doctor", {"id": rng.choice(targets["doctor_ids"])}
+    if endpoint == "conversations_user":
+        return "GET", "/conversations/user", {"id": rng.choice(targets["user_ids"])}
+    return "GET", "/conversations", {"appointment_id": rng.choice(targets["appointment_ids"])}
+
+
+def start_server(port: int) -> uvicorn.Server:
+    """Serve main.app from a background thread (its own event loop), like a single uvicorn worker."""
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
+async def load(session: aiohttp.ClientSession, base_url: str, endpoint: str, targets: dict, requests: int,
+               concurrency: int, rng: random.Random) -> tuple[list[float], int, float]:
+    """Send `requests` requests from `concurrency` workers; returns (latencies ms, errors, elapsed seconds)."""
+    plan = [make_request(endpoint, targets, rng) for _ in range(requests)]
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while plan:
+            method, path, payload = plan.pop()
+            kwargs = {"json": payload} if method == "POST" else {"params": payload}
+            started = time.perf_counter()
+            try:
+                async with session.request(method, base_url + path, **kwargs) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_load(base_url: str, targets: dict, counter: CommandCounter, requests: int, concurrency: int,
+                   warmup: int, rng: random.Random) -> dict:
+    results = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for endpoint in ENDPOINTS:
+            await load(session, base_url, endpoint, targets, warmup, concurrency, rng)
+            counter.count = 0
+            latencies, errors, elapsed = await load(session, base_url, endpoint, targets, requests, concurrency, rng)
+            latencies.sort()
+            results[endpoint] = {
+                "requests": requests,
+                "errors": errors,
+                "p50_ms": round(percentile(latencies, 0.50), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+                "requests_per_sec": round(requests / elapsed, 1),
+                "mongo_round_trips_per_request": round(counter.count / requests, 2),
+            }
+    return results
+
+
+def compare(results: dict, baseline: dict, latency_tolerance: float, throughput_tolerance: float) -> list[str]:
+    """Every regression of `results` against `baseline`, as one line each."""
+    regressions = []
+    for endpoint, current in results["endpoints"].items():
+        if current["errors"]:
+            regressions.append(f"{endpoint}: {current['errors']} failed requests")
+        previous = baseline["endpoints"].get(endpoint)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[key] > previous[key] * (1 + latency_tolerance):
+                regressions.append(f"{endpoint}: {key} {previous[key]} -> {current[key]}")
+        if current["requests_per_sec"] < previous["requests_per_sec"] * (1 - throughput_tolerance):
+            regressions.append(f"{endpoint}: requests_per_sec {previous['requests_per_sec']} -> {current['requests_per_sec']}")
+        # Round-trips don't depend on machine load, so any increase is a regression
+        if current["mongo_round_trips_per_request"] > previous["mongo_round_trips_per_request"]:
+            regressions.append(f"{endpoint}: mongo_round_trips_per_request "
+                               f"{previous['mongo_round_trips_per_request']} -> {current['mongo_round_trips_per_request']}")
+    return regressions
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the FastAPI read endpoints")
+    parser.add_argument("--mongo-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.getenv("BENCH_DB", "healthcare_bench"))
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--appointments", type=int, default=5)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="generator worker processes")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in --db")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests per endpoint first")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default="bench_api.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed latency increase (0.2 = 20%%)")
+    parser.add_argument("--throughput-tolerance", type=float, default=0.2, help="allowed throughput drop")
+    args = parser.parse_args()
+
+    # Read first: --out may overwrite the baseline file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    db = MongoClient(args.mongo_url)[args.db]
+    if not args.skip_seed:
+        seed(db, args.users, args.appointments, args.doctors, args.seed, args.workers, args.mongo_url)
+    targets = sample_targets(db)
+
+    # The app's client is created in its lifespan, after the listener is registered
+    counter = CommandCounter()
+    monitoring.register(counter)
+    os.environ["MONGODB_URL"] = args.mongo_url
+    os.environ["MONGODB_DB"] = args.db
+    server = start_server(args.port)
+
+    try:
+        endpoints = asyncio.run(run_load(f"http://127.0.0.1:{args.port}", targets, counter, args.requests,
+                                         args.concurrency, args.warmup, random.Random(args.seed)))
+    finally:
+        server.should_exit = True
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "dataset": {"users": args.users, "appointments_per_user": args.appointments, "doctors": args.doctors, "seed": args.seed},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "endpoints": endpoints,
+    }
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'endpoint':>18} | {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} | {'req/s':>7} | {'trips/req':>9} | {'errors':>6}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:>18} | {stats['p50_ms']:>7} {stats['p95_ms']:>7} {stats['p99_ms']:>7} | "
+              f"{stats['requests_per_sec']:>7} | {stats['mongo_round_trips_per_request']:>9} | {stats['errors']:>6}")
+    print(f"📄 Results written to {args.out}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.latency_tolerance, args.throughput_tolerance)
+        if regressions:
+            print("❌ Regressions against " + args.baseline + ":\n" + "\n".join(regressions))
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_booking.py
+# Concurrency check for create_appointment: hundreds of sessions try to book the
+# same doctor slot at once and exactly one of them may win. The old
+# find_one-then-insert_one check is run the same way for comparison.
+#   cd src && python -m benchmarks.bench_booking
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+
+from db.booking import insert_booking_async, slot_starts
+from db.indexes import ensure_indexes_async
+
+load_dotenv(".env.local")
+
+DOCTOR_ID = str(ObjectId())
+SLOT = datetime(2025, 1, 6, 17)
+
+
+def appointment(start: datetime) -> dict:
+    end = start + timedelta(hours=1)
+    return {
+        "user_id": str(ObjectId()),
+        "doctor_id": DOCTOR_ID,
+        "issue": "Appointment regarding Flu",
+        "start_datetime": start,
+        "end_datetime": end,
+        "slots": slot_starts(start, end),
+        "confirmation": "confirmed",
+        "created_at": datetime.now(),
+    }
+
+
+async def check_then_insert(calendar, doc: dict) -> str | None:
+    """The previous create_appointment: a separate overlap query before the insert."""
+    conflict = await calendar.find_one({
+        "doctor_id": doc["doctor_id"],
+        "start_datetime": {"$lte": doc["start_datetime"] + timedelta(minutes=55)},
+        "end_datetime": {"$gte": doc["start_datetime"] - timedelta(minutes=55)},
+    })
+    if conflict:
+        return None
+    return str((await calendar.insert_one(doc)).inserted_id)
+
+
+async def race(calendar, book, starts: list[datetime]) -> tuple[int, float]:
+    """Fire one booking per start time at once; returns (bookings that succeeded, elapsed ms)."""
+    started = time.perf_counter()
+    results = await asyncio.gather(*(book(calendar, appointment(start)) for start in starts))
+    return sum(result is not None for result in results), (time.perf_counter() - started) * 1000
+
+
+async def main(mongo_url: str, db_name: str, sessions=500):
+    client = AsyncMongoClient(mongo_url, maxPoolSize=100)
+    db = client[db_name]
+    scenarios = {
+        "same slot": [SLOT] * sessions,
+        # Every start within the same hour overlaps every other one
+        "overlapping starts": [SLOT + timedelta(minutes=5 * (i % 12)) for i in range(sessions)],
+    }
+
+    print(f"{'scenario':>18} | {'check+insert wins':>17} | {'slot reservation wins':>21} {'ms':>7}")
+    for name, starts in scenarios.items():
+        await db.calendars.drop()
+        old_wins, _ = await race(db.calendars, check_then_insert, starts)
+
+        await db.calendars.drop()
+        await ensure_indexes_async(db)
+        wins, elapsed_ms = await race(db.calendars, insert_booking_async, starts)
+        print(f"{name:>18} | {old_wins:>17} | {wins:>21} {elapsed_ms:>7.0f}")
+        assert wins == 1, f"{name}: {wins} bookings won the same slot"
+
+    # Back-to-back hours don't collide
+    await db.calendars.drop()
+    await ensure_indexes_async(db)
+    wins, _ = await race(db.calendars, insert_booking_async, [SLOT + timedelta(hours=i) for i in range(24)])
+    assert wins == 24, f"adjacent hours: only {wins} of 24 booked"
+
+    await client.drop_database(db.name)
+    await client.close()
+    print("✅ Exactly one booking per slot")
+
+
+def parse_args():
+    # A local mongod by default, never the MONGODB_URL the services use: the run drops its database
+    parser = argparse.ArgumentParser(description="Concurrent bookings of one doctor slot")
+    parser.add_argument("--mongo-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.getenv("BENCH_DB", "healthcare_bench"))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(args.mongo_url, args.db))
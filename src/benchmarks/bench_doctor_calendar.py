@@ -0,0 +1,114 @@
+# bench_doctor_calendar.py
+# Round-trips and latency of /calendar/doctor against appointment count:
+# the old per-appointment users lookup versus the single $lookup aggregation.
+#   cd src && python -m benchmarks.bench_doctor_calendar
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+from db.indexes import ensure_indexes
+from db.queries import doctor_appointment_response, doctor_calendar_pipeline, with_patients
+
+load_dotenv(".env.local")
+
+DOCTOR_ID = str(ObjectId())
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the commands (round-trips) sent to the server."""
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def n_plus_one(db, doctor_id: str) -> list[dict]:
+    """The previous implementation: one users.find_one per appointment."""
+    appointments = []
+    for calendar in db.calendars.find({"doctor_id": doctor_id}):
+        user = db.users.find_one({"_id": ObjectId(calendar["user_id"])})
+        calendar["user"] = user
+        appointments.append(doctor_appointment_response(calendar))
+    return appointments
+
+
+def aggregated(db, doctor_id: str) -> list[dict]:
+    docs = with_patients(list(db.calendars.aggregate(doctor_calendar_pipeline(doctor_id))))
+    return [doctor_appointment_response(doc) for doc in docs]
+
+
+def seed(db, count: int):
+    db.users.drop()
+    db.calendars.drop()
+    ensure_indexes(db)
+
+    users = [
+        {"name": f"Patient {i}", "email": f"patient{i}@example.com", "phone": f"+1555{i:07d}", "type": "patient"}
+        for i in range(count)
+    ]
+    user_ids = db.users.insert_many(users).inserted_ids
+    start = datetime(2025, 1, 1, 9)
+    db.calendars.insert_many([
+        {
+            "user_id": str(user_id),
+            "doctor_id": DOCTOR_ID,
+            "issue": "Appointment regarding Flu",
+            "start_datetime": start + timedelta(hours=i),
+            "end_datetime": start + timedelta(hours=i + 1),
+            "confirmation": "confirmed",
+            "created_at": start,
+        }
+        for i, user_id in enumerate(user_ids)
+    ])
+
+
+def measure(fn, db, counter: CommandCounter, runs: int):
+    samples = []
+    for _ in range(runs):
+        counter.count = 0
+        started = time.perf_counter()
+        result = fn(db, DOCTOR_ID)
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, counter.count, statistics.median(samples)
+
+
+def main(mongo_url: str, db_name: str, counts=(10, 100, 300, 1000), runs=5):
+    counter = CommandCounter()
+    client = MongoClient(mongo_url, event_listeners=[counter])
+    db = client[db_name]
+
+    print(f"{'appointments':>12} | {'N+1 trips':>9} {'N+1 ms':>8} | {'$lookup trips':>13} {'$lookup ms':>10}")
+    for count in counts:
+        seed(db, count)
+        old, old_trips, old_ms = measure(n_plus_one, db, counter, runs)
+        new, new_trips, new_ms = measure(aggregated, db, counter, runs)
+        assert sorted(old, key=str) == sorted(new, key=str), "responses differ"
+        print(f"{count:>12} | {old_trips:>9} {old_ms:>8.1f} | {new_trips:>13} {new_ms:>10.1f}")
+
+    client.drop_database(db.name)
+
+
+def parse_args():
+    # A local mongod by default, never the MONGODB_URL the services use: the run drops its database
+    parser = argparse.ArgumentParser(description="Round-trips of /calendar/doctor against appointment count")
+    parser.add_argument("--mongo-url", default=os.getenv("BENCH_MONGODB_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.getenv("BENCH_DB", "healthcare_bench"))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.mongo_url, args.db)
@@ -0,0 +1,133 @@
+# bench_follow_up.py
+# Follow-up campaign dispatcher against a fake dispatch API: throughput at several
+# concurrency limits, per-trunk rate limiting, dedup and resuming from a checkpoint.
+#   cd src && python -m benchmarks.bench_follow_up
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from campaigns.follow_up import FollowUpDispatcher, follow_up_window
+
+TRUNKS = ["ST_a", "ST_b", "ST_c"]
+WINDOW = follow_up_window(7, now=datetime(2025, 1, 13, 9))
+
+
+class FakeDispatchAPI:
+    """
+    Stands in for LiveKitAPI.agent_dispatch: fixed latency, optional failures, records every
+    dispatched room (also to `log_path`, so a killed process's calls can still be counted).
+    """
+    def __init__(self, latency: float = 0.02, failure_rate: float = 0.0, log_path: str | None = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.log = open(log_path, "a") if log_path else None
+        self.rooms = []
+
+    async def __call__(self, room: str, metadata: str):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("dispatch rejected")
+        self.rooms.append(room)
+        if self.log:
+            self.log.write(room + "\n")
+            self.log.flush()
+
+
+def make_candidates(patients: int, appointments_per_patient: int = 1) -> list[dict]:
+    candidates = []
+    for _ in range(patients):
+        user_id = str(ObjectId())
+        for _ in range(appointments_per_patient):
+            candidates.append({"appointment_id": str(ObjectId()), "user_id": user_id, "phone": "+15550000000"})
+    return candidates
+
+
+async def stream(candidates: list[dict]):
+    for candidate in candidates:
+        yield candidate
+
+
+async def throughput(patients=2000, concurrencies=(10, 50, 200)):
+    print(f"{'concurrency':>11} | {'dispatched':>10} {'seconds':>8} {'dispatches/sec':>14}")
+    candidates = make_candidates(patients)
+    for concurrency in concurrencies:
+        fake = FakeDispatchAPI()
+        # Rate limit high enough that only concurrency and latency matter here
+        dispatcher = FollowUpDispatcher(fake, TRUNKS, max_concurrency=concurrency, calls_per_second=100000)
+        stats = await dispatcher.run(stream(candidates), WINDOW)
+        assert stats["dispatched"] == patients
+        print(f"{concurrency:>11} | {stats['dispatched']:>10} {stats['seconds']:>8.2f} {stats['dispatches_per_sec']:>14.0f}")
+
+
+async def rate_limit(calls_per_second=20, seconds=2):
+    fake = FakeDispatchAPI(latency=0)
+    dispatcher = FollowUpDispatcher(fake, TRUNKS, max_concurrency=50, calls_per_second=calls_per_second)
+    stats = await dispatcher.run(stream(make_candidates(calls_per_second * len(TRUNKS) * seconds)), WINDOW)
+    observed = stats["dispatched"] / stats["seconds"]
+    limit = calls_per_second * len(TRUNKS)
+    print(f"⏱️ Rate limit {limit}/sec over {len(TRUNKS)} trunks: observed {observed:.1f}/sec, per trunk {stats['per_trunk']}")
+    assert observed <= limit * 1.1
+
+
+def run_until_killed(candidates: list[dict], checkpoint: str, log_path: str):
+    """Child process of dedup_and_resume: runs the campaign until it is SIGKILLed."""
+    fake = FakeDispatchAPI(latency=0.001, log_path=log_path)
+    dispatcher = FollowUpDispatcher(fake, TRUNKS, max_concurrency=10, calls_per_second=100000, checkpoint_path=checkpoint)
+    asyncio.run(dispatcher.run(stream(candidates), WINDOW))
+
+
+def count_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+async def dedup_and_resume(patients=500, max_concurrency=10):
+    candidates = make_candidates(patients, appointments_per_patient=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+        log_path = os.path.join(tmp, "dialed.log")
+
+        # First run is SIGKILLed part way through the campaign: no finally, no cleanup
+        child = multiprocessing.Process(target=run_until_killed, args=(candidates, checkpoint, log_path))
+        child.start()
+        # Not a multiple of any save interval, so a periodic checkpoint would be stale
+        while count_lines(log_path) < patients // 2 + 23:
+            time.sleep(0.001)
+        os.kill(child.pid, signal.SIGKILL)
+        child.join()
+        with open(log_path) as f:
+            before = f.read().split()
+
+        fake = FakeDispatchAPI(latency=0.001, failure_rate=0.05)
+        dispatcher = FollowUpDispatcher(fake, TRUNKS, max_concurrency=max_concurrency, calls_per_second=100000,
+                                        checkpoint_path=checkpoint, backoff_seconds=0.001)
+        stats = await dispatcher.run(stream(candidates), WINDOW)
+
+    rooms = before + fake.rooms
+    repeated = len(rooms) - len(set(rooms))
+    print(f"🔁 {len(before)} calls before the kill, {stats['resumed']} skipped on resume, "
+          f"{stats['dispatched']} dispatched after it, {repeated} called again, "
+          f"{stats['duplicates']} duplicate appointments skipped")
+    # Only dispatches still in flight at the kill (accepted, not yet checkpointed) can repeat
+    assert repeated <= max_concurrency, "patients called before the kill were called again"
+    assert len(set(rooms)) + stats["failed"] == patients, "a patient was missed"
+
+
+async def main():
+    await throughput()
+    await rate_limit()
+    await dedup_and_resume()
+    print("✅ Follow-up dispatcher checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,223 @@
+# follow_up.py
+# Follow-up call campaigns: one feedback call per patient whose appointment ended
+# in a time window and who hasn't given feedback yet, dispatched to the feedback
+# agent through a single shared dispatch client.
+import asyncio
+import json
+import os
+import time
+from collections.abc import AsyncIterator
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+
+from db.queries import follow_up_candidates_pipeline
+
+load_dotenv(".env.local")
+
+FOLLOW_UP_AGENT = "my-telephony-agent"
+SIP_TRUNK_IDS = [t.strip() for t in os.getenv("SIP_TRUNK_IDS", "ST_6xaaSRD7hsnH").split(",") if t.strip()]
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, in bursts of up to `burst`."""
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Checkpoint:
+    """
+    Campaign progress in a JSON lines file: a header naming the window, then one
+    {user_id, appointment_id} line per dispatched call, appended and fsynced as soon
+    as the dispatch succeeds. A kill at any point loses at most the dispatches that
+    were still in flight; a torn last line from such a kill is ignored on resume.
+    """
+    def __init__(self, path: str | None, window: tuple[datetime, datetime]):
+        self.path = path
+        self.window = [window[0].isoformat(), window[1].isoformat()]
+        self.dispatched = {}
+        self.file = None
+        if not path:
+            return
+        if os.path.exists(path):
+            with open(path) as f:
+                content = f.read()
+            lines = content.splitlines()
+            try:
+                header = json.loads(lines[0]) if lines else {}
+            except ValueError:
+                header = {}
+            # A checkpoint of another window belongs to another campaign
+            if header.get("window") == self.window:
+                # Checkpoints written before progress was appended per dispatch
+                self.dispatched.update(header.get("dispatched", {}))
+                for line in lines[1:]:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.dispatched[entry["user_id"]] = entry["appointment_id"]
+                self.file = open(path, "a")
+                if not content.endswith("\n"):
+                    # Start after a torn last line instead of on it
+                    self.file.write("\n")
+                return
+        self.file = open(path, "w")
+        self._write({"window": self.window})
+
+    def done(self, user_id: str) -> bool:
+        return user_id in self.dispatched
+
+    def record(self, user_id: str, appointment_id: str):
+        self.dispatched[user_id] = appointment_id
+        if self.file:
+            self._write({"user_id": user_id, "appointment_id": appointment_id})
+
+    def _write(self, entry: dict):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def follow_up_window(days_after: int | None = None, now: datetime | None = None,
+                     day: date | None = None) -> tuple[datetime, datetime]:
+    """
+    The whole day of appointments that ended `days_after` days ago (FOLLOW_UP_AFTER_DAYS,
+    one week by default), midnight to midnight, so every run on the same day gets the
+    same window and resumes its checkpoint. `day` picks the day explicitly, e.g. to
+    resume a campaign the day after it was stopped.
+    """
+    if day is None:
+        if days_after is None:
+            days_after = int(os.getenv("FOLLOW_UP_AFTER_DAYS", "7"))
+        day = (now or datetime.now()).date() - timedelta(days=days_after)
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+async def follow_up_candidates(db, start: datetime, end: datetime) -> AsyncIterator[dict]:
+    """Stream {appointment_id, user_id, phone} of every appointment to follow up, from an AsyncMongoClient db."""
+    results = await db.calendars.aggregate(follow_up_candidates_pipeline(start, end))
+    async for candidate in results:
+        yield candidate
+
+
+class FollowUpDispatcher:
+    """
+    Dispatches one follow-up call per candidate through `dispatch(room, metadata)`,
+    the shared client's create-dispatch call (a fake one in benchmarks).
+      - at most `max_concurrency` dispatches in flight
+      - each call is assigned a SIP trunk round-robin, and every trunk is held to
+        `calls_per_second` so a campaign can't exceed the carrier's call rate
+      - a patient with several appointments in the window is called once
+      - dispatched patients are checkpointed, so a rerun of the same window resumes
+        instead of calling them again; failed dispatches are retried on the rerun
+    """
+    def __init__(self, dispatch, trunk_ids: list[str] | None = None, max_concurrency: int | None = None,
+                 calls_per_second: float | None = None, checkpoint_path: str | None = None,
+                 max_attempts: int = 3, backoff_seconds: float = 0.5):
+        self.dispatch = dispatch
+        self.trunk_ids = trunk_ids or SIP_TRUNK_IDS
+        self.max_concurrency = max_concurrency or int(os.getenv("FOLLOW_UP_MAX_CONCURRENCY", "20"))
+        calls_per_second = calls_per_second or float(os.getenv("FOLLOW_UP_CALLS_PER_SECOND", "5"))
+        self.limiters = {trunk_id: RateLimiter(calls_per_second) for trunk_id in self.trunk_ids}
+        self.checkpoint_path = checkpoint_path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+
+        self.dispatched = 0
+        self.duplicates = 0
+        self.resumed = 0
+        self.failed = []
+        self.per_trunk = dict.fromkeys(self.trunk_ids, 0)
+
+    async def run(self, candidates: AsyncIterator[dict], window: tuple[datetime, datetime]) -> dict:
+        """Dispatch every candidate and return the campaign stats."""
+        checkpoint = Checkpoint(self.checkpoint_path, window)
+        queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+        seen = set()
+        started = time.perf_counter()
+
+        async def work():
+            while True:
+                candidate, trunk_id = await queue.get()
+                try:
+                    if await self._dispatch(candidate, trunk_id):
+                        checkpoint.record(candidate["user_id"], candidate["appointment_id"])
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(work()) for _ in range(self.max_concurrency)]
+        try:
+            n = 0
+            async for candidate in candidates:
+                user_id = candidate["user_id"]
+                if checkpoint.done(user_id):
+                    self.resumed += 1
+                    continue
+                if user_id in seen:
+                    self.duplicates += 1
+                    continue
+                seen.add(user_id)
+                await queue.put((candidate, self.trunk_ids[n % len(self.trunk_ids)]))
+                n += 1
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            checkpoint.close()
+
+        return self.stats(time.perf_counter() - started)
+
+    async def _dispatch(self, candidate: dict, trunk_id: str) -> bool:
+        metadata = json.dumps({
+            "phone_number": candidate["phone"],
+            "appointment_id": candidate["appointment_id"],
+            "sip_trunk_id": trunk_id,
+        })
+        room = f"follow-up-{candidate['appointment_id']}"
+        for attempt in range(1, self.max_attempts + 1):
+            await self.limiters[trunk_id].acquire()
+            try:
+                await self.dispatch(room, metadata)
+                self.dispatched += 1
+                self.per_trunk[trunk_id] += 1
+                return True
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    print(f"❌ Follow-up dispatch for appointment {candidate['appointment_id']} failed: {e}")
+                    self.failed.append(candidate["appointment_id"])
+                    return False
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+    def stats(self, elapsed: float) -> dict:
+        return {
+            "dispatched": self.dispatched,
+            "duplicates": self.duplicates,
+            "resumed": self.resumed,
+            "failed": len(self.failed),
+            "per_trunk": self.per_trunk,
+            "seconds": elapsed,
+            "dispatches_per_sec": self.dispatched / elapsed if elapsed else 0.0,
+        }
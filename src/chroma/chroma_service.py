@@ -1,68 +1,266 @@
 from pathlib import Path
 from typing import Dict, List
+import hashlib
 import chromadb
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 import os
+import time
 
 from dotenv import load_dotenv
 
 load_dotenv(".env.local")
 import pandas as pd
 
+from chroma.embedding_store import EmbeddingStore
+from chroma.symptom_index import SymptomIndex
+from utils.ttl_cache import TTLCache
+
+
+def normalize_symptom(symptom: str) -> str:
+    """Lower-case and collapse whitespace so equivalent symptoms share cache entries."""
+    return " ".join(symptom.lower().split())
+
+def load_catalogue(path: str) -> pd.DataFrame:
+    """Read the health-issue sheet (id, health_issue, symptoms, advice) from Excel, CSV or Parquet."""
+    path = Path(path).resolve()
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        df = pd.read_csv(path)
+    elif suffix == ".parquet":
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_excel(path)
+    return df.dropna(subset=["id", "symptoms"])
+
+
 class ChromaService:
     """
     Alternative approach: Store each symptom as a separate document.
     This can provide even better individual symptom matching.
     """
-    def __init__(self):
-        # local chroma
-        # self.client = chromadb.PersistentClient(path="./chroma_db")
-        # cloud chroma
-        self.client = chromadb.CloudClient(
-            api_key=os.environ["CHROMA_API_KEY"],
-            tenant=os.environ["CHROMA_TENANT"],
-            database=os.environ["CHROMA_DATABASE"],
+    def __init__(self, mode: str | None = None):
+        # CHROMA_MODE picks where the collection lives:
+        #   cloud      - Chroma Cloud, every query is a remote call
+        #   persistent - local chroma at CHROMA_PATH, queries served by the in-process SymptomIndex
+        #   memory     - ephemeral chroma seeded from CHROMA_EXCEL_PATH, queries served by the SymptomIndex
+        self.mode = mode or os.getenv("CHROMA_MODE", "cloud")
+        self.embedding_function = DefaultEmbeddingFunction()
+        # Documents and query symptoms are embedded here (through the on-disk store) and
+        # handed to chroma as vectors, so the model only runs on text it has never seen
+        self.embedding_store = EmbeddingStore(
+            os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache"), type(self.embedding_function).__name__
         )
-        self.collection = self.client.get_or_create_collection("health_issues")
-
-    def excel_to_collection(self, excel_path: str):
-        excel_path = Path(excel_path).resolve()
-        df = pd.read_excel(excel_path)
-
-        for _, row in df.iterrows():
-            symptoms_list = [s.strip().lower() for s in row["symptoms"].split(",") if s.strip()]
-            
-            # Store each symptom as a separate document with shared metadata
-            for symptom_idx, symptom in enumerate(symptoms_list):
-                doc_id = f"{row['id']}_{symptom_idx}"
-                self.collection.add(
-                    ids=[doc_id],
-                    metadatas=[{
-                        "health_issue_id": str(row["id"]),
-                        "health_issue": row["health_issue"],
-                        "all_symptoms": row["symptoms"], 
-                        "advice": row["advice"],
-                        "symptom": symptom
-                    }],
-                    documents=[symptom]
-                )
-
-    def query(self, user_symptoms: List[str], n_results=3) -> List[Dict]:
-        """Query by aggregating scores across individual symptom matches (deduped per query symptom)."""
-        all_matches = {}
 
-        for symptom in user_symptoms:
-            results = self.collection.query(
-                query_texts=[symptom.lower()],
-                n_results=100,
+        if self.mode == "cloud":
+            self.client = chromadb.CloudClient(
+                api_key=os.environ["CHROMA_API_KEY"],
+                tenant=os.environ["CHROMA_TENANT"],
+                database=os.environ["CHROMA_DATABASE"],
             )
+        elif self.mode == "persistent":
+            self.client = chromadb.PersistentClient(path=os.getenv("CHROMA_PATH", "./chroma_db"))
+        elif self.mode == "memory":
+            self.client = chromadb.EphemeralClient()
+        else:
+            raise ValueError(f"Unknown CHROMA_MODE: {self.mode}")
+
+        self.collection = self.client.get_or_create_collection(
+            "health_issues", embedding_function=self.embedding_function
+        )
+        # Neighbours fetched per query symptom before per-issue aggregation
+        self.n_candidates = int(os.getenv("CHROMA_QUERY_FANOUT", "100"))
+
+        # Both caches live in this process. In the voice agent that is one call's job process,
+        # so they only serve repeated symptom checks within that call; the TTL and LRU bound
+        # them in long-lived processes (the API, scripts). What survives across calls is the
+        # on-disk EmbeddingStore above, which saves the model inference.
+        cache_size = int(os.getenv("CHROMA_CACHE_SIZE", "1024"))
+        cache_ttl = float(os.getenv("CHROMA_CACHE_TTL", "3600"))
+        self.result_cache = TTLCache(max_size=cache_size, ttl_seconds=cache_ttl)
+        self.symptom_cache = TTLCache(max_size=cache_size, ttl_seconds=cache_ttl)
+
+        self.index = None
+        if self.mode != "cloud":
+            if self.mode == "memory":
+                self.excel_to_collection(os.getenv("CHROMA_EXCEL_PATH", "healthcare_data.xlsx"))
+            self.reload_index()
+
+    def reload_index(self):
+        """(Re)load the in-process SymptomIndex from the collection."""
+        self.index = SymptomIndex.from_collection(self.collection)
+        print(f"📚 Loaded {len(self.index)} symptom embeddings into the local index")
+
+    def excel_to_collection(self, excel_path: str, batch_size: int | None = None) -> Dict:
+        """
+        Bulk, idempotent ingestion of the health-issue catalogue (Excel, CSV or Parquet).
+
+        Every symptom becomes its own document ("<id>_<symptom_idx>"). Rows whose content hash
+        matches what is already stored are skipped, changed rows are upserted in batches and
+        documents of symptoms or rows that were removed from the sheet are deleted.
+        """
+        started = time.perf_counter()
+        batch_size = batch_size or int(os.getenv("CHROMA_INGEST_BATCH", "256"))
+        df = load_catalogue(excel_path)
+
+        df["health_issue_id"] = df["id"].astype(str)
+        df["content_hash"] = (df["health_issue"] + "\x1f" + df["symptoms"] + "\x1f" + df["advice"]).map(
+            lambda content: hashlib.sha1(content.encode()).hexdigest()
+        )
+
+        # One row per symptom, numbered per health issue after dropping empty entries
+        docs = df.assign(symptom=df["symptoms"].str.split(",")).explode("symptom")
+        docs["symptom"] = docs["symptom"].str.strip().str.lower()
+        docs = docs[docs["symptom"].fillna("") != ""]
+        docs["doc_id"] = docs["health_issue_id"] + "_" + docs.groupby("health_issue_id").cumcount().astype(str)
+
+        # Compare per document so a partially ingested row is repaired on the next run
+        stored = self._stored_hashes(batch_size)
+        changed = docs[docs["doc_id"].map(stored) != docs["content_hash"]]
+        current_ids = set(docs["doc_id"])
+        removed = [doc_id for doc_id in stored if doc_id not in current_ids]
+
+        ids = changed["doc_id"].tolist()
+        documents = changed["symptom"].tolist()
+        metadatas = changed.rename(columns={"symptoms": "all_symptoms"})[
+            ["health_issue_id", "health_issue", "all_symptoms", "advice", "symptom", "content_hash"]
+        ].to_dict("records")
+
+        for offset in range(0, len(ids), batch_size):
+            self.collection.upsert(
+                ids=ids[offset:offset + batch_size],
+                embeddings=self.embed(documents[offset:offset + batch_size]),
+                metadatas=metadatas[offset:offset + batch_size],
+                documents=documents[offset:offset + batch_size],
+            )
+        for offset in range(0, len(removed), batch_size):
+            self.collection.delete(ids=removed[offset:offset + batch_size])
+
+        self.clear_cache()
+        if self.index is not None:
+            self.reload_index()
 
+        elapsed = time.perf_counter() - started
+        stats = {
+            "rows": len(df),
+            "rows_changed": int(changed["health_issue_id"].nunique()),
+            "documents_upserted": len(ids),
+            "documents_deleted": len(removed),
+            "seconds": elapsed,
+            "rows_per_sec": len(df) / elapsed if elapsed else 0.0,
+        }
+        print(
+            f"📥 Ingested {stats['rows']} rows ({stats['rows_changed']} changed, "
+            f"{stats['documents_upserted']} upserted, {stats['documents_deleted']} deleted) "
+            f"in {elapsed:.2f}s — {stats['rows_per_sec']:.0f} rows/sec"
+        )
+        return stats
+
+    def _stored_hashes(self, batch_size: int) -> Dict[str, str]:
+        """Map of every stored document id to the content hash of the row it came from."""
+        stored = {}
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            for doc_id, meta in zip(page["ids"], page["metadatas"]):
+                stored[doc_id] = (meta or {}).get("content_hash")
+            if len(page["ids"]) < batch_size:
+                return stored
+            offset += batch_size
+
+    def query(self, user_symptoms: List[str], n_results=3, n_candidates: int | None = None, batched: bool = True, use_cache: bool = True) -> List[Dict]:
+        """
+        Query by aggregating scores across individual symptom matches (deduped per query symptom).
+
+        Rankings are cached on the normalized, sorted symptoms plus `n_results`, and the raw
+        neighbour list of each symptom is cached separately so new combinations of already
+        seen symptoms need no remote call.
+        Outside cloud mode the local SymptomIndex answers the whole query in-process.
+        Otherwise all uncached symptoms are sent in a single `collection.query` call when `batched` is set;
+        otherwise one call per symptom is made (the original behaviour, kept for comparison).
+        `n_candidates` is the number of neighbours fetched per symptom (defaults to CHROMA_QUERY_FANOUT).
+        """
+        query_texts = [normalize_symptom(symptom) for symptom in user_symptoms]
+        query_texts = [text for text in query_texts if text]
+        if not query_texts:
+            return []
+
+        n_candidates = n_candidates or self.n_candidates
+
+        cache_key = (tuple(sorted(query_texts)), n_results, n_candidates)
+        if use_cache:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return [dict(match) for match in cached]
+
+        if self.index is not None:
+            output = self.index.rank(self.embed(query_texts), n_results, n_candidates)
+        else:
+            output = self._rank(self._neighbours(query_texts, n_candidates, batched, use_cache), n_results)
+
+        if use_cache:
+            self.result_cache.set(cache_key, [dict(match) for match in output])
+        return output
+
+    def _neighbours(self, query_texts: List[str], n_candidates: int, batched: bool, use_cache: bool) -> Dict:
+        """Raw Chroma neighbour lists for each query text, served from the per-symptom cache when possible."""
+        neighbours = {}
+        if use_cache:
+            for text in query_texts:
+                cached = self.symptom_cache.get((text, n_candidates))
+                if cached is not None:
+                    neighbours[text] = cached
+
+        missing = list(dict.fromkeys(text for text in query_texts if text not in neighbours))
+        if missing:
+            if batched:
+                fetched = self.collection.query(query_embeddings=self.embed(missing), n_results=n_candidates)
+            else:
+                fetched = {"ids": [], "metadatas": [], "distances": []}
+                for text in missing:
+                    single = self.collection.query(query_embeddings=self.embed([text]), n_results=n_candidates)
+                    for key in fetched:
+                        fetched[key].append(single[key][0])
+
+            for i, text in enumerate(missing):
+                neighbours[text] = (fetched["ids"][i], fetched["metadatas"][i], fetched["distances"][i])
+                if use_cache:
+                    self.symptom_cache.set((text, n_candidates), neighbours[text])
+
+        return {
+            "ids": [neighbours[text][0] for text in query_texts],
+            "metadatas": [neighbours[text][1] for text in query_texts],
+            "distances": [neighbours[text][2] for text in query_texts],
+        }
+
+    def embed(self, texts: List[str]):
+        """Embed texts, reusing vectors from the on-disk embedding store."""
+        return self.embedding_store.embed(texts, self.embedding_function)
+
+    def clear_cache(self):
+        """Drop cached rankings and neighbour lists, e.g. after the collection was re-ingested."""
+        self.result_cache.clear()
+        self.symptom_cache.clear()
+
+    def cache_stats(self) -> Dict:
+        """Hit/miss counters of both cache levels."""
+        return {
+            "results": self.result_cache.stats(),
+            "symptoms": self.symptom_cache.stats(),
+            "embeddings": self.embedding_store.stats(),
+        }
+
+    def _rank(self, results: Dict, n_results: int) -> List[Dict]:
+        """Aggregate per-symptom neighbour lists into health issues ranked by (match_count desc, avg_distance asc)."""
+        all_matches = {}
+
+        for ids, metadatas, distances in zip(results['ids'], results['metadatas'], results['distances']):
             # Track which health issues were already matched for this query symptom
             seen_in_this_query = set()
 
-            for i, doc_id in enumerate(results['ids'][0]):
-                meta = results['metadatas'][0][i]
+            for i in range(len(ids)):
+                meta = metadatas[i]
                 health_issue_id = meta['health_issue_id']
-                distance = results['distances'][0][i]
+                distance = distances[i]
 
                 # Skip if already matched this issue for the current query symptom
                 if health_issue_id in seen_in_this_query:
@@ -101,10 +299,34 @@ class ChromaService:
         return output[:n_results]
 
 
+def compare_query_latency(service: ChromaService, user_symptoms: List[str], n_results=3, runs=5):
+    """Time the per-symptom and batched query paths and check they rank identically."""
+    timings = {}
+    outputs = {}
+    for batched in (False, True):
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            outputs[batched] = service.query(user_symptoms, n_results=n_results, batched=batched, use_cache=False)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        timings["batched" if batched else "sequential"] = samples[len(samples) // 2]
+
+    same = [r["id"] for r in outputs[False]] == [r["id"] for r in outputs[True]]
+    print(
+        f"⏱️ {len(user_symptoms)} symptoms: sequential {timings['sequential']:.1f} ms, "
+        f"batched {timings['batched']:.1f} ms (median of {runs}), same ranking: {same}"
+    )
+    return timings
+
+
 # For testing purposes
 if __name__ == "__main__":
     service = ChromaService()
     # to reset collection
     # service.client.delete_collection("health_issues")
+    # re-running ingestion only upserts changed rows
     # service.excel_to_collection("healthcare_data.xlsx")
     print(service.query(["headache", "cough"], n_results=3))
+    compare_query_latency(service, ["fever", "cough", "headache", "nausea"])
+    print(service.cache_stats())
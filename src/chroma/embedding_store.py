@@ -0,0 +1,139 @@
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    Content-addressed on-disk embedding cache.
+    Vectors are appended to a float32 file that is read back through a memory map,
+    and an append-only JSON lines index maps sha1(model + text) to the row holding its vector.
+    Every agent job process shares the cache directory, so appends hold an exclusive
+    flock on `<model>.lock` from picking the row to writing the index lines; other
+    processes pick up new lines by reading the index from where they left off.
+    """
+    def __init__(self, path: str, model_name: str):
+        self.model_name = model_name
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / f"{model_name}.f32"
+        self.index_path = self.dir / f"{model_name}.index.jsonl"
+        self.lock_path = self.dir / f"{model_name}.lock"
+
+        self.dim = None
+        self.rows = {}
+        # Bytes of the index already read into `rows`
+        self.index_offset = 0
+        with self._locked():
+            self._migrate_json_index()
+        self._refresh()
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def embed(self, texts: List[str], embedding_function) -> np.ndarray:
+        """Embeddings for `texts`, running `embedding_function` only on texts never seen before."""
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+
+        keys = [self.key(text) for text in texts]
+        if any(key not in self.rows for key in keys):
+            # Another process may have embedded them since
+            self._refresh()
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in self.rows))
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            self._append(missing, np.asarray(embedding_function(missing), dtype=np.float32))
+
+        vectors = self._mapped()
+        return np.array(vectors[[self.rows[key] for key in keys]])
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _refresh(self):
+        """Read the index lines appended since the last refresh (complete lines only)."""
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn by a process that died mid-append
+                continue
+            if "dim" in entry:
+                self.dim = entry["dim"]
+            else:
+                self.rows[entry["key"]] = entry["row"]
+        self.index_offset += end
+        if self.rows:
+            self._vectors = None
+
+    def _migrate_json_index(self):
+        # Index written as one JSON document (rewritten on every append) by earlier versions
+        old_path = self.dir / f"{self.model_name}.json"
+        if self.index_path.exists() or not old_path.exists():
+            return
+        data = json.loads(old_path.read_text())
+        lines = [{"dim": data["dim"]}] + [{"key": key, "row": row} for key, row in data["rows"].items()]
+        self.index_path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+        old_path.unlink()
+
+    def _append(self, texts: List[str], vectors: np.ndarray):
+        with self._locked():
+            self._refresh()
+            if self.index_path.exists() and self.index_path.stat().st_size > self.index_offset:
+                # A torn last line: end it so the lines below start on their own
+                with open(self.index_path, "ab") as f:
+                    f.write(b"\n")
+                self._refresh()
+            new = [(text, vector) for text, vector in zip(texts, vectors) if self.key(text) not in self.rows]
+            if not new:
+                return
+            lines = []
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                lines.append({"dim": self.dim})
+            row_bytes = self.dim * 4
+            # Rows written by a run that died before indexing them are left orphaned, not reused
+            first_row = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(first_row * row_bytes)
+                f.write(np.stack([vector for _, vector in new]).tobytes())
+            lines += [{"key": self.key(text), "row": first_row + offset} for offset, (text, _) in enumerate(new)]
+            # Only the new lines are written, however large the index has grown
+            with open(self.index_path, "ab") as f:
+                f.write("".join(json.dumps(line) + "\n" for line in lines).encode())
+            self._refresh()
+        self._vectors = None
+
+    def _mapped(self) -> np.ndarray:
+        if self._vectors is None:
+            n_rows = self.vectors_path.stat().st_size // (self.dim * 4)
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+        return self._vectors
+
+    def stats(self) -> dict:
+        return {"size": len(self.rows), "hits": self.hits, "misses": self.misses}
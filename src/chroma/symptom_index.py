@@ -0,0 +1,79 @@
+from typing import Dict, List
+
+import numpy as np
+
+
+class SymptomIndex:
+    """
+    In-process copy of the health_issues collection.
+    One embedding row per symptom document, with rows grouped by health issue so that
+    per-issue dedup and ranking can be done with vectorized reductions instead of a Chroma round-trip.
+    """
+    def __init__(self, embeddings, metadatas: List[Dict]):
+        issue_ids = np.array([meta["health_issue_id"] for meta in metadatas])
+        # Group rows of the same health issue next to each other
+        order = np.argsort(issue_ids, kind="stable")
+
+        if len(metadatas):
+            self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(metadatas), -1)[order]
+        else:
+            # Empty collection (not ingested yet): rank() returns nothing until it is reloaded
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+
+        _, self.group_starts = np.unique(issue_ids[order], return_index=True)
+        self.issues = [metadatas[order[start]] for start in self.group_starts]
+
+    @classmethod
+    def from_collection(cls, collection) -> "SymptomIndex":
+        """Load every symptom embedding of a Chroma collection once."""
+        data = collection.get(include=["embeddings", "metadatas"])
+        return cls(data["embeddings"], data["metadatas"])
+
+    def __len__(self):
+        return len(self.sq_norms)
+
+    def rank(self, query_embeddings, n_results=3, n_candidates=100) -> List[Dict]:
+        """
+        Score all query symptoms with one matrix multiply and rank health issues
+        by more matches (desc) and smaller avg distance (asc), like ChromaService.query.
+        """
+        if len(self) == 0:
+            return []
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+
+        # Squared L2, the distance Chroma reports for its default space
+        distances = q_norms[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.embeddings.T)
+        np.maximum(distances, 0.0, out=distances)
+
+        # Only the n_candidates nearest documents of each query symptom count as matches
+        if n_candidates < len(self):
+            nearest = np.argpartition(distances, n_candidates - 1, axis=1)[:, :n_candidates]
+            candidates = np.full_like(distances, np.inf)
+            np.put_along_axis(candidates, nearest, np.take_along_axis(distances, nearest, axis=1), axis=1)
+            distances = candidates
+
+        # Nearest document per (query symptom, health issue): the per-query dedup
+        per_issue = np.minimum.reduceat(distances, self.group_starts, axis=1)
+        matched = np.isfinite(per_issue)
+        match_count = matched.sum(axis=0)
+        total_distance = np.where(matched, per_issue, 0.0).sum(axis=0)
+
+        hits = np.flatnonzero(match_count)
+        avg_distance = total_distance[hits] / match_count[hits]
+        order = np.lexsort((avg_distance, -match_count[hits]))[:n_results]
+
+        output = []
+        for pos in order:
+            meta = self.issues[hits[pos]]
+            output.append({
+                "id": meta["health_issue_id"],
+                "health_issue": meta["health_issue"],
+                "symptoms": meta["all_symptoms"],
+                "advice": meta["advice"],
+                "avg_distance": float(avg_distance[pos]),
+                "match_count": int(match_count[hits[pos]])
+            })
+        return output
@@ -0,0 +1,201 @@
+# async_mongo_service.py
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+from pymongo.errors import DuplicateKeyError
+
+from db.availability import find_free_slots_async
+from db.booking import insert_booking_async
+from db.indexes import ensure_indexes_async, phone_query
+from db.mongo_service import DOCTOR_ID, build_appointment, build_conversation, build_feedback
+from db.user_cache import UserCache
+from models.user import User
+
+load_dotenv(".env.local")
+
+
+class AsyncMongoService:
+    """
+    Non-blocking counterpart of MongoService for code running on the agent's event loop.
+    Same methods, awaited instead of called.
+    """
+    def __init__(self):
+        logging.getLogger("pymongo").setLevel(logging.WARNING)
+        mongo_url = os.getenv("MONGODB_URL")
+        if not mongo_url:
+            raise ValueError("MONGODB_URL not found in .env.local")
+
+        self.client = AsyncMongoClient(mongo_url)
+        self.db = self.client["healthcare_db"]
+        self.users = self.db["users"]
+        self.calendar = self.db["calendars"]
+        self.conversations = self.db["conversations"]
+        self.feedback = self.db["feedback"]
+        self.user_cache = UserCache()
+        self.warmed = False
+
+    async def warm(self):
+        """Open the connection pool and make sure indexes exist, once per process."""
+        if self.warmed:
+            return
+        try:
+            await self.client.admin.command("ping")
+            await self.ensure_indexes()
+            self.warmed = True
+        except Exception as e:
+            print(f"⚠️ Could not warm MongoDB connection: {e}")
+
+    async def ensure_indexes(self):
+        """Create the indexes behind the hot lookups (no-op when they already exist)."""
+        await ensure_indexes_async(self.db)
+
+    async def close(self):
+        await self.client.close()
+
+    async def fetch_user_by_id(self, user_id: str) -> User | None:
+        """
+        Fetch a user by its string _id (through the user cache) and return a User instance.
+        """
+        try:
+            return await self._cached_user("id", user_id, {"_id": ObjectId(user_id)})
+        except Exception as e:
+            print(f"Error fetching user: {e}")
+            return None
+
+    async def fetch_user_by_phone(self, phone_number: str) -> User | None:
+        """
+        Fetch a user by phone number (through the user cache) and return a User instance.
+        """
+        try:
+            return await self._cached_user("phone", phone_number, phone_query(phone_number))
+        except Exception as e:
+            print(f"Error fetching user by phone: {e}")
+            return None
+
+    async def _cached_user(self, field: str, value: str, query: dict) -> User | None:
+        found, user = self.user_cache.lookup(field, value)
+        if found:
+            return user
+
+        started = time.perf_counter()
+        doc = await self.users.find_one(query, User.PROJECTION)
+        user = User.from_document(doc) if doc else None
+        self.user_cache.store(field, value, user, (time.perf_counter() - started) * 1000)
+        if not user:
+            print(f"⚠️ No user found with {field}: {value}")
+        return user
+
+    def invalidate_user(self, user_id: str | None = None, phone: str | None = None):
+        """Call after a users document is created, updated or deleted."""
+        self.user_cache.invalidate(user_id=user_id, phone=phone)
+
+    async def create_appointment(self, user_id: str, issue: str, datetime_iso: str, confirmation: str):
+        """
+        Insert a 1-hour, timezone-aware appointment unless it overlaps one of the doctor's.
+        The overlap check is the insert itself, so concurrent bookings can't double-book.
+        """
+        appointment = build_appointment(user_id, issue, datetime_iso, confirmation)
+        appointment_id = await insert_booking_async(self.calendar, appointment)
+        if appointment_id:
+            print(f"✅ Appointment created for {appointment['start_datetime']} (ID: {appointment_id})")
+        return appointment_id
+
+    async def find_free_slots(self, start: datetime, end: datetime, limit: int | None = None) -> list[datetime]:
+        """Start times in [start, end) at which the doctor can still be booked (see db/availability.py)."""
+        return await find_free_slots_async(self.calendar, DOCTOR_ID, start, end, limit)
+
+    async def get_appointments(self, user_id: str):
+        """Fetch all appointments for a user."""
+        return await self.calendar.find({"user_id": user_id}).to_list(length=None)
+
+    async def delete_appointment(self, appointment_id: str):
+        """Remove appointment if needed."""
+        return await self.calendar.delete_one({"_id": ObjectId(appointment_id)})
+
+    async def save_conversation_summary(self, user_id: str, issue: str, symptoms: list[str], recommendations: list[str],
+                                        appointment_id: str | None, idempotency_key: str | None = None) -> str:
+        """
+        Save summarized conversation after call ends. Saving again with the same
+        `idempotency_key` (the job id) returns the summary already stored for it.
+        """
+        conversation = build_conversation(user_id, issue, symptoms, recommendations, appointment_id, idempotency_key)
+
+        try:
+            result = await self.conversations.insert_one(conversation)
+        except DuplicateKeyError:
+            existing = await self.conversations.find_one({"idempotency_key": idempotency_key}, {"_id": 1})
+            return str(existing["_id"])
+        print(f"💾 Conversation saved (ID: {result.inserted_id})")
+        return str(result.inserted_id)
+
+    async def save_feedback(self, appointment_id, user_id: str, feedback: str, improved: bool, notes: str, timestamp: datetime) -> str:
+        """Save a patient's follow-up call feedback."""
+        result = await self.feedback.insert_one(build_feedback(appointment_id, user_id, feedback, improved, notes, timestamp))
+        return str(result.inserted_id)
+
+    async def fetch_appointment_by_id(self, appointment_id: str):
+        """Fetch appointment by its ID."""
+        return await self.calendar.find_one({"_id": ObjectId(appointment_id)})
+
+
+async def measure_loop_lag(lookup, sessions=50, calls_per_session=10, tick=0.005) -> dict:
+    """
+    Run `sessions` concurrent simulated calls, each awaiting `lookup()` repeatedly,
+    while a probe measures how late the event loop wakes it up (the stall every other
+    session's audio would see).
+    """
+    lags = []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(tick)
+            lags.append(time.perf_counter() - started - tick)
+
+    async def session():
+        for _ in range(calls_per_session):
+            await lookup()
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    lags.sort()
+    return {
+        "seconds": elapsed,
+        "max_lag_ms": lags[-1] * 1000 if lags else 0.0,
+        "p95_lag_ms": lags[int(len(lags) * 0.95)] * 1000 if lags else 0.0,
+    }
+
+
+# For testing purposes
+if __name__ == "__main__":
+    from db.mongo_service import MongoService
+
+    phone = "+12096841862"
+
+    async def compare():
+        sync_service = MongoService()
+        async_service = AsyncMongoService()
+
+        async def blocking_lookup():
+            sync_service.fetch_user_by_phone(phone)
+
+        async def async_lookup():
+            await async_service.fetch_user_by_phone(phone)
+
+        print(f"sync MongoService:  {await measure_loop_lag(blocking_lookup)}")
+        print(f"AsyncMongoService: {await measure_loop_lag(async_lookup)}")
+        await async_service.close()
+
+    asyncio.run(compare())
@@ -0,0 +1,118 @@
+# availability.py
+# Free appointment times of a doctor: one indexed range query for the busy
+# appointments in the window, then an in-memory sweep over working hours.
+import os
+from datetime import datetime, time, timedelta
+
+import pytz
+from dotenv import load_dotenv
+
+load_dotenv(".env.local")
+
+# Clinic hours, in the same local timezone build_appointment books in
+LOCAL_TZ = pytz.timezone("US/Pacific")
+WORKDAY_START_HOUR = int(os.getenv("WORKDAY_START_HOUR", "9"))
+WORKDAY_END_HOUR = int(os.getenv("WORKDAY_END_HOUR", "17"))
+WORKING_DAYS = {0, 1, 2, 3, 4}  # Monday to Friday
+APPOINTMENT_MINUTES = 60
+# Offered start times are multiples of this past the start of the workday
+AVAILABILITY_STEP_MINUTES = int(os.getenv("AVAILABILITY_STEP_MINUTES", "30"))
+# Longest appointment an earlier start can stretch into the window from
+MAX_APPOINTMENT = timedelta(days=1)
+
+BUSY_PROJECTION = {"_id": 0, "start_datetime": 1, "end_datetime": 1}
+
+
+def localize(value: datetime) -> datetime:
+    """Naive datetimes are clinic-local times; aware ones are converted to the clinic timezone."""
+    return LOCAL_TZ.localize(value) if value.tzinfo is None else value.astimezone(LOCAL_TZ)
+
+
+def _from_mongo(value: datetime) -> datetime:
+    # Mongo hands datetimes back naive, in UTC
+    return pytz.utc.localize(value) if value.tzinfo is None else value
+
+
+def busy_query(doctor_id: str, start: datetime, end: datetime) -> dict:
+    """
+    Appointments of `doctor_id` overlapping [start, end). The bounded start_datetime
+    range is what the doctor_start_id index scans; end_datetime is checked on those docs.
+    """
+    return {
+        "doctor_id": doctor_id,
+        "start_datetime": {"$gte": start - MAX_APPOINTMENT, "$lt": end},
+        "end_datetime": {"$gt": start},
+    }
+
+
+def working_windows(start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+    """Working hours of every working day between start and end, clipped to [start, end)."""
+    windows = []
+    day = start.astimezone(LOCAL_TZ).date()
+    while day <= end.astimezone(LOCAL_TZ).date():
+        if day.weekday() in WORKING_DAYS:
+            opens = LOCAL_TZ.localize(datetime.combine(day, time(WORKDAY_START_HOUR)))
+            closes = LOCAL_TZ.localize(datetime.combine(day, time(WORKDAY_END_HOUR)))
+            if max(opens, start) < min(closes, end):
+                windows.append((opens, closes))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_slots(busy: list[dict], start: datetime, end: datetime, limit: int | None = None,
+               duration: timedelta = timedelta(minutes=APPOINTMENT_MINUTES),
+               step: timedelta = timedelta(minutes=AVAILABILITY_STEP_MINUTES)) -> list[datetime]:
+    """
+    Sweep the busy appointments (sorted by start_datetime, as busy_query returns them)
+    across the working windows and return every start time in [start, end) at which a
+    `duration` appointment fits without overlapping one of them. Times are clinic-local.
+    """
+    start, end = localize(start), localize(end)
+    intervals = [(_from_mongo(doc["start_datetime"]), _from_mongo(doc["end_datetime"])) for doc in busy]
+    slots = []
+    i = 0
+    for opens, closes in working_windows(start, end):
+        # First step of the workday at or after `start`
+        candidate = opens
+        if candidate < start:
+            candidate += -((opens - start) // step) * step
+        # Appointments that ended before this workday can't block anything later
+        while i < len(intervals) and intervals[i][1] <= candidate:
+            i += 1
+        j = i
+        while candidate + duration <= closes and candidate < end:
+            slot_end = candidate + duration
+            # Skip appointments ending before the candidate; the first one left decides
+            while j < len(intervals) and intervals[j][1] <= candidate:
+                j += 1
+            blocker = None
+            for busy_start, busy_end in intervals[j:]:
+                if busy_start >= slot_end:
+                    break
+                if busy_end > candidate:
+                    blocker = (busy_start, busy_end)
+                    break
+            if blocker is None:
+                slots.append(candidate.astimezone(LOCAL_TZ))
+                if limit and len(slots) == limit:
+                    return slots
+                candidate += step
+            else:
+                # Jump to the first step at or after the blocking appointment ends
+                candidate += -((candidate - blocker[1]) // step) * step
+    return slots
+
+
+def find_free_slots(calendar, doctor_id: str, start: datetime, end: datetime, limit: int | None = None) -> list[datetime]:
+    """Free start times of `doctor_id` in [start, end); naive bounds are clinic-local."""
+    start, end = localize(start), localize(end)
+    busy = list(calendar.find(busy_query(doctor_id, start, end), BUSY_PROJECTION).sort("start_datetime", 1))
+    return free_slots(busy, start, end, limit)
+
+
+async def find_free_slots_async(calendar, doctor_id: str, start: datetime, end: datetime,
+                                limit: int | None = None) -> list[datetime]:
+    """find_free_slots for an AsyncMongoClient collection."""
+    start, end = localize(start), localize(end)
+    busy = await calendar.find(busy_query(doctor_id, start, end), BUSY_PROJECTION).sort("start_datetime", 1).to_list(length=None)
+    return free_slots(busy, start, end, limit)
@@ -0,0 +1,95 @@
+# booking.py
+# Race-free appointment booking. Every appointment carries the start of each
+# BOOKING_SLOT_MINUTES slot it covers in `slots`, and the unique (doctor_id, slots)
+# index in db/indexes.py lets only one appointment hold a given doctor slot.
+# The conflict check and the insert are therefore the same atomic insert_one.
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError
+
+load_dotenv(".env.local")
+
+SLOT_MINUTES = int(os.getenv("BOOKING_SLOT_MINUTES", "5"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Mongo hands datetimes back naive, in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def slot_starts(start: datetime, end: datetime, slot_minutes: int = SLOT_MINUTES) -> list[datetime]:
+    """
+    UTC start of every slot that [start, end) touches. Two appointments of the same
+    doctor overlap exactly when they share one of these (for slot-aligned times;
+    unaligned times are rounded outwards, so they can only be stricter).
+    """
+    slot = timedelta(minutes=slot_minutes)
+    start, end = _as_utc(start), _as_utc(end)
+    current = _EPOCH + ((start - _EPOCH) // slot) * slot
+    slots = []
+    while current < end:
+        slots.append(current)
+        current += slot
+    return slots
+
+
+def insert_booking(calendar, appointment: dict) -> str | None:
+    """Insert `appointment` unless one of its slots is taken. Returns the new id, or None on a conflict."""
+    try:
+        return str(calendar.insert_one(appointment).inserted_id)
+    except DuplicateKeyError as e:
+        _report_conflict(appointment, e)
+        return None
+
+
+async def insert_booking_async(calendar, appointment: dict) -> str | None:
+    """insert_booking for an AsyncMongoClient collection."""
+    try:
+        return str((await calendar.insert_one(appointment)).inserted_id)
+    except DuplicateKeyError as e:
+        _report_conflict(appointment, e)
+        return None
+
+
+def _report_conflict(appointment: dict, error: DuplicateKeyError):
+    taken = (error.details or {}).get("keyValue", {}).get("slots")
+    print(f"⚠️ Conflict detected: doctor already has an appointment at {taken or appointment['start_datetime']}")
+
+
+def backfill_slots(db) -> dict:
+    """
+    Give appointments created before slot reservation their `slots`, so new bookings
+    also collide with them. Overlapping legacy appointments can't both hold a slot;
+    they are reported and left without one.
+    """
+    updated = 0
+    overlapping = []
+    for doc in db.calendars.find({"slots": {"$exists": False}}, {"start_datetime": 1, "end_datetime": 1}):
+        try:
+            db.calendars.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"slots": slot_starts(doc["start_datetime"], doc["end_datetime"])}},
+            )
+            updated += 1
+        except DuplicateKeyError:
+            overlapping.append(str(doc["_id"]))
+    return {"updated": updated, "overlapping": overlapping}
+
+
+if __name__ == "__main__":
+    from db.mongo_service import MongoService
+
+    parser = argparse.ArgumentParser(description="Reserve slots for appointments booked before slot reservation")
+    parser.add_argument("--backfill", action="store_true", help="add slots to every calendars document missing them")
+    args = parser.parse_args()
+
+    if args.backfill:
+        result = backfill_slots(MongoService().db)
+        print(f"✅ Reserved slots for {result['updated']} appointments")
+        for appointment_id in result["overlapping"]:
+            print(f"⚠️ {appointment_id} overlaps another appointment, left without slots")
@@ -1,24 +1,29 @@
-from datetime import datetime, timedelta, time
+# generate_data.py
+# Synthetic healthcare_db data for profiling: N patients with M appointments each,
+# spread over a set of doctors in non-overlapping working-hour slots, and one
+# conversation per appointment. Written in insert_many batches, optionally from
+# several worker processes, and determined by --seed (and --batch-size).
+#   cd src && python -m db.generate_data --users 10000 --appointments 5 --doctors 20 --workers 4
+import argparse
+import os
+import random
+import struct
+import time as clock
+from datetime import date, datetime, time, timedelta
+from math import gcd
+from multiprocessing import Pool
+
+import pytz
+from bson import ObjectId
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from faker import Faker
-import random
-import os
-
-load_dotenv(".env.local")
-
-# Conenct to database
-mongodb_client = MongoClient(os.environ["MONGODB_URL"])
-db = mongodb_client.healthcare_db
+from pymongo import MongoClient
 
-# Collections
-users = db.users
-calendars = db.calendars
-conversations = db.conversations
+from db.booking import slot_starts
+from db.indexes import ensure_indexes
+from db.mongo_service import DOCTOR_ID
 
-# Generate fake data
-fake = Faker('en_US')
-Faker.seed(round(random.randint(0, 100000)))
+load_dotenv(".env.local")
 
 # Health Issues
 ws = []
@@ -123,44 +128,22 @@ ws.append([97, "Calf Tightness", "tight calves, pulling sensation, discomfort du
 ws.append([98, "Abdominal Tightness", "stomach muscle tenderness, stiffness, discomfort when bending", "light stretching, warm compress, slow breathing, avoid heavy meals"])
 ws.append([99, "Mild Overwork Fatigue", "mental tiredness, slow focus, low motivation", "short break, light snack, drink water, gentle movement"])
 
-from datetime import datetime, timedelta, time
-import random
 
-def generate_weekday_appointment(
-    working_start=time(9, 0),
-    working_end=time(17, 0),
-    duration_minutes=60
-):
-    # Hardcoded date range (inclusive)
-    start_date = datetime(2025, 10, 22)
-    end_date = datetime(2025, 10, 25)
+LOCAL_TZ = pytz.timezone("US/Pacific")
+WORKING_START = time(9, 0)
+SLOTS_PER_DAY = 8  # one-hour appointments, 9:00 to 17:00
+# Fixed creation time embedded in generated ObjectIds, so ids only depend on the seed
+ID_EPOCH = int(datetime(2025, 1, 1, tzinfo=pytz.utc).timestamp())
+ID_KINDS = {"doctor": 1, "user": 2, "calendar": 3, "conversation": 4}
 
-    delta_days = (end_date - start_date).days
-    random_day = start_date + timedelta(days=random.randint(0, delta_days))
 
-    # Random hour within working window
-    start_hour = random.randint(working_start.hour, working_end.hour - 1)
+def object_id(kind: str, seed: int, index: int):
+    """Reproducible, unique ObjectId of the `index`-th generated document of `kind`."""
+    return ObjectId(struct.pack(">IBHBI", ID_EPOCH, ID_KINDS[kind], seed & 0xFFFF, 0, index))
 
-    start_dt = datetime(
-        random_day.year,
-        random_day.month,
-        random_day.day,
-        start_hour,
-        0
-    )
 
-    end_dt = start_dt + timedelta(minutes=duration_minutes)
-
-    return {
-        "start_datetime": start_dt,
-        "end_datetime": end_dt,
-        "confirmation": "confirmed",
-        "created_at": datetime.now()
-    }
-
-    
-def get_random_health_issue():
-    entry = random.choice(ws)
+def get_random_health_issue(rng: random.Random = random):
+    entry = rng.choice(ws)
 
     issue = entry[1]
     symptoms = [s.strip() for s in entry[2].split(",")]
@@ -173,71 +156,205 @@ def get_random_health_issue():
     }
 
 
-def generate_user():
-    user = {
-        "name": fake.name(),
-        "email": fake.email(),
-        "phone": fake.numerify("+1##########"),
+def doctor_ids(doctors: int, seed: int) -> list[str]:
+    """The first doctor is the one the agent books with (DOCTOR_ID)."""
+    return [DOCTOR_ID] + [str(object_id("doctor", seed, i)) for i in range(1, doctors)]
+
+
+class SlotPlan:
+    """
+    Gives every appointment of the dataset its own (doctor, slot): appointment g is
+    sent through a seeded affine permutation of [0, total) and the result split into a
+    doctor and a working-hour slot index. Doctors are never double-booked, patients'
+    appointments land on scattered days, and any worker can place any appointment
+    without coordinating with the others.
+    """
+    def __init__(self, total: int, doctors: list[str], first_day: date, seed: int):
+        self.total = total
+        self.doctors = doctors
+        self.first_day = first_day
+        rng = random.Random(seed)
+        self.step = rng.randrange(1, max(total, 2))
+        while gcd(self.step, total) != 1:
+            self.step += 1
+        self.offset = rng.randrange(total)
+
+    def place(self, g: int) -> tuple[str, datetime]:
+        position = (self.step * g + self.offset) % self.total
+        slot = position // len(self.doctors)
+        return self.doctors[position % len(self.doctors)], self.slot_start(slot)
+
+    def slot_start(self, slot: int) -> datetime:
+        business_day, hour = divmod(slot, SLOTS_PER_DAY)
+        weeks, weekday = divmod(business_day, 5)
+        day = self.first_day + timedelta(weeks=weeks, days=weekday)
+        return LOCAL_TZ.localize(datetime.combine(day, WORKING_START) + timedelta(hours=hour))
+
+
+def plan_first_day(total: int, doctors: int, today: date | None = None) -> date:
+    """Monday such that about half of the appointments are past and half upcoming."""
+    today = today or date.today()
+    weeks = total // doctors // SLOTS_PER_DAY // 5 + 1
+    monday = today - timedelta(days=today.weekday())
+    return monday - timedelta(weeks=weeks // 2)
+
+
+def generate_user(u: int, fake: Faker, seed: int) -> dict:
+    # email and phone are unique indexes, so both are derived from the patient number
+    name = fake.name()
+    return {
+        "_id": object_id("user", seed, u),
+        "name": name,
+        "email": f"{name.lower().replace(' ', '.')}.{u}@example.com",
+        "phone": f"+1{2000000000 + u}",
         "type": "patient"
     }
-    user = users.insert_one(user)
-    return user
 
-from datetime import datetime
 
-def generate_calendar(user_id: str, health: dict, time: dict):
+def generate_calendar(g: int, user_id, health: dict, plan: SlotPlan, now: datetime, rng: random.Random, seed: int) -> dict:
+    doctor_id, start = plan.place(g)
+    end = start + timedelta(hours=1)
     # Determine status based on whether appointment has already ended
-    status = "completed" if time["end_datetime"] < datetime.now() else "confirmed"
+    status = "completed" if end < now else "confirmed"
 
-    calendar = {
+    return {
+        "_id": object_id("calendar", seed, g),
         "user_id": str(user_id),
-        "doctor_id": "68fc65ca4916df00cfe6ec9d",
+        "doctor_id": doctor_id,
         "issue": f"Appointment regarding {health['issue']}",
-        "start_datetime": time["start_datetime"],
-        "end_datetime": time["end_datetime"],
-        "confirmation": status,   # <---- status applied here
-        "created_at": time["created_at"]
+        "start_datetime": start,
+        "end_datetime": end,
+        "slots": slot_starts(start, end),
+        "confirmation": status,
+        # Booked over the phone a few days ahead
+        "created_at": start - timedelta(days=rng.randint(1, 14), minutes=rng.randint(0, 600))
     }
 
-    result = calendars.insert_one(calendar)
-    return result
-
-
 
-def generate_conversation(user_id: str, health: dict, time: dict, calendar: dict):
-    conversation = {
+def generate_conversation(g: int, user_id, health: dict, calendar: dict, seed: int) -> dict:
+    return {
+        "_id": object_id("conversation", seed, g),
         "user_id": str(user_id),
         "issue": health["issue"],
         "symptoms": health["symptoms"],
-        "recommendations" : health["recommendations"],
-        "appointment_id": str(calendar.inserted_id),
-        "created_at": datetime.now()
+        "recommendations": health["recommendations"],
+        "appointment_id": str(calendar["_id"]),
+        "created_at": calendar["created_at"]
     }
-    conversation = conversations.insert_one(conversation)
-    return conversation
-
-def main():
-    for _ in range(1):
-        health_issue = get_random_health_issue()
-        print(health_issue)
 
-        time = generate_weekday_appointment()
-        print(time)
 
-        # user = generate_user()
-        user = {
-            "inserted_id": "68fdf8c6b830ab32db40416f"
-        }
-        print(user["inserted_id"])
-
-        calendar = generate_calendar(user["inserted_id"], health=health_issue, time=time)
-        print(calendar)
-
-        conversation = generate_conversation(user["inserted_id"], health=health_issue, time=time, calendar=calendar)
-        print(conversation)
+def connect(mongo_url: str, db_name: str):
+    """`mongomock` gives an in-memory database (single process only)."""
+    if mongo_url == "mongomock":
+        import mongomock
+        return mongomock.MongoClient()[db_name]
+    return MongoClient(mongo_url)[db_name]
+
+
+def generate_chunk(db, first_user: int, last_user: int, appointments: int, plan: SlotPlan, seed: int,
+                   batch_size: int) -> dict:
+    """Generate and insert patients [first_user, last_user) with their appointments and conversations."""
+    # Seeded per chunk, so the data doesn't depend on how chunks are spread over workers
+    rng = random.Random(seed * 1_000_003 + first_user)
+    fake = Faker("en_US")
+    fake.seed_instance(seed * 1_000_003 + first_user)
+    now = datetime.now(pytz.utc)
+
+    users, calendars, conversations = [], [], []
+    for u in range(first_user, last_user):
+        user = generate_user(u, fake, seed)
+        users.append(user)
+        for j in range(appointments):
+            g = u * appointments + j
+            health = get_random_health_issue(rng)
+            calendar = generate_calendar(g, user["_id"], health, plan, now, rng, seed)
+            calendars.append(calendar)
+            conversations.append(generate_conversation(g, user["_id"], health, calendar, seed))
+
+    for collection, docs in (("users", users), ("calendars", calendars), ("conversations", conversations)):
+        for i in range(0, len(docs), batch_size):
+            db[collection].insert_many(docs[i:i + batch_size], ordered=False)
+    return {"users": len(users), "calendars": len(calendars), "conversations": len(conversations)}
+
+
+def _generate_chunk_in_worker(args) -> dict:
+    mongo_url, db_name, *chunk_args = args
+    return generate_chunk(connect(mongo_url, db_name), *chunk_args)
+
+
+def generate(db, users: int, appointments: int, doctors: int, seed: int = 0, batch_size: int = 1000,
+             workers: int = 1, mongo_url: str | None = None, today: date | None = None) -> dict:
+    """
+    Fill `db` with the synthetic dataset and return document counts and docs/sec.
+    With workers > 1, chunks are inserted from separate processes, each opening its own
+    client to `mongo_url`.
+    """
+    started = clock.perf_counter()
+    doctors_ids = doctor_ids(doctors, seed)
+    fake = Faker("en_US")
+    fake.seed_instance(seed)
+    # Upserted: DOCTOR_ID may already be in the database
+    for i, doctor_id in enumerate(doctors_ids):
+        db.users.update_one({"_id": ObjectId(doctor_id)}, {"$setOnInsert": {
+            "name": f"Dr. {fake.name()}",
+            "email": f"doctor{i}@example.com",
+            "phone": f"+1{1000000000 + i}",
+            "type": "doctor",
+        }}, upsert=True)
+
+    total = max(users * appointments, 1)
+    plan = SlotPlan(total, doctors_ids, plan_first_day(total, doctors, today), seed)
+    chunks = [(u, min(u + batch_size, users), appointments, plan, seed, batch_size) for u in range(0, users, batch_size)]
+
+    counts = {"users": doctors, "calendars": 0, "conversations": 0}
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = pool.map(_generate_chunk_in_worker, [(mongo_url, db.name, *chunk) for chunk in chunks])
+    else:
+        results = [generate_chunk(db, *chunk) for chunk in chunks]
+    for result in results:
+        for collection, n in result.items():
+            counts[collection] += n
+
+    elapsed = clock.perf_counter() - started
+    docs = sum(counts.values())
+    return {**counts, "docs": docs, "seconds": elapsed, "docs_per_sec": docs / elapsed if elapsed else 0.0}
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic healthcare_db dataset")
+    parser.add_argument("--users", type=int, default=1000, help="number of patients")
+    parser.add_argument("--appointments", type=int, default=3, help="appointments (and conversations) per patient")
+    parser.add_argument("--doctors", type=int, default=10, help="number of doctors sharing the appointments")
+    parser.add_argument("--seed", type=int, default=0, help="same seed and batch size, same dataset")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per insert_many, and patients per chunk")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    # Never the app's MONGODB_URL: this is meant for a local mongod (or mongomock)
+    parser.add_argument("--mongo-url", help="MongoDB URL, or mongomock for an in-memory run "
+                                            "(default BENCH_MONGODB_URL, else mongodb://localhost:27017)")
+    parser.add_argument("--db", default="healthcare_db", help="database name")
+    parser.add_argument("--drop", action="store_true", help="drop users, calendars and conversations first")
+    args = parser.parse_args()
+
+    if args.drop and args.db == "healthcare_db" and not args.mongo_url:
+        parser.error("--drop on healthcare_db needs an explicit --mongo-url")
+    args.mongo_url = args.mongo_url or os.getenv("BENCH_MONGODB_URL", "mongodb://localhost:27017")
+
+    if args.mongo_url == "mongomock" and args.workers > 1:
+        print("⚠️ mongomock lives in one process, running with a single worker")
+        args.workers = 1
+
+    db = connect(args.mongo_url, args.db)
+    if args.drop:
+        for collection in ("users", "calendars", "conversations"):
+            db[collection].drop()
+
+    stats = generate(db, args.users, args.appointments, args.doctors, args.seed, args.batch_size, args.workers, args.mongo_url)
+    # Built after the load, which is faster than maintaining them during it
+    ensure_indexes(db)
+    print(f"✅ {stats['users']} users, {stats['calendars']} appointments, {stats['conversations']} conversations "
+          f"in {stats['seconds']:.1f}s — {stats['docs_per_sec']:.0f} docs/sec")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,149 @@
+# indexes.py
+import argparse
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from db.availability import busy_query
+from db.queries import page_filter, page_sort
+
+# Indexes backing every hot lookup on healthcare_db
+INDEXES = {
+    "users": [
+        # inbound SIP calls: find_one(phone_query(...)); users without a phone are left out
+        IndexModel([("phone", ASCENDING)], name="phone_unique", unique=True,
+                   partialFilterExpression={"phone": {"$type": "string"}}),
+        # /login: find_one({"email": ...})
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "calendars": [
+        # /calendar/user pages, ordered by (start_datetime, _id)
+        IndexModel([("user_id", ASCENDING), ("start_datetime", ASCENDING), ("_id", ASCENDING)], name="user_start_id"),
+        # /calendar/doctor pages and the busy-time range query of /calendar/availability
+        IndexModel([("doctor_id", ASCENDING), ("start_datetime", ASCENDING), ("_id", ASCENDING)], name="doctor_start_id"),
+        # create_appointment: one appointment per doctor slot (db/booking.py); legacy docs without slots are skipped
+        IndexModel([("doctor_id", ASCENDING), ("slots", ASCENDING)], name="doctor_slots_unique", unique=True,
+                   partialFilterExpression={"slots": {"$exists": True}}),
+        # follow-up campaigns: appointments that ended in a window
+        IndexModel([("end_datetime", ASCENDING), ("_id", ASCENDING)], name="end_id"),
+    ],
+    "conversations": [
+        # /conversations?appointment_id=...
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id"),
+        # /conversations/user pages, ordered by (created_at, _id)
+        IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="user_created_id"),
+        # save_conversation_summary retries: one summary per call
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_unique", unique=True,
+                   partialFilterExpression={"idempotency_key": {"$exists": True}}),
+    ],
+    "feedback": [
+        # outcome of an appointment, and the no-feedback-yet join of follow-up campaigns
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id"),
+    ],
+}
+
+
+def phone_query(phone: str) -> dict:
+    """Filter of the inbound-call user lookup; repeats phone_unique's partial filter so the planner can use it."""
+    return {"phone": {"$eq": phone, "$type": "string"}}
+
+
+def production_queries() -> list[tuple[str, dict, list | None]]:
+    """Representative filter (and sort, for paged listings) of every production query."""
+    now = datetime.now()
+    week_ago = now - timedelta(days=7)
+    return [
+        ("users", phone_query("+10000000000"), None),
+        ("users", {"email": "nobody@example.com"}, None),
+        ("users", {"_id": ObjectId()}, None),
+        ("calendars", page_filter({"user_id": str(ObjectId())}, "start_datetime", start=week_ago), page_sort("start_datetime")),
+        ("calendars", page_filter({"doctor_id": str(ObjectId())}, "start_datetime", start=week_ago), page_sort("start_datetime")),
+        ("calendars", busy_query(str(ObjectId()), now, now + timedelta(days=7)), [("start_datetime", ASCENDING)]),
+        ("calendars", {"_id": ObjectId()}, None),
+        ("calendars", {"end_datetime": {"$gte": week_ago - timedelta(days=1), "$lt": week_ago}}, [("end_datetime", ASCENDING), ("_id", ASCENDING)]),
+        ("conversations", {"appointment_id": str(ObjectId())}, None),
+        ("feedback", {"appointment_id": str(ObjectId())}, None),
+        ("conversations", page_filter({"user_id": str(ObjectId())}, "created_at", start=week_ago), page_sort("created_at")),
+    ]
+
+
+def ensure_indexes(db):
+    """
+    Create any missing index. Safe to run on every startup.
+    Indexes are created one at a time, so one that can't be built (e.g. duplicate
+    emails in old data) doesn't keep the others from being created.
+    """
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                db[collection].create_indexes([model])
+            except OperationFailure as e:
+                print(f"⚠️ Could not create index {model.document['name']} on {collection}: {e}")
+
+
+async def ensure_indexes_async(db):
+    """ensure_indexes for an AsyncMongoClient database."""
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                print(f"⚠️ Could not create index {model.document['name']} on {collection}: {e}")
+
+
+def _plan_stages(plan) -> list[str]:
+    """Every stage name in an explain() plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_plan_stages(value))
+    return stages
+
+
+def winning_plan_stages(explain: dict) -> list[str]:
+    return _plan_stages(explain["queryPlanner"]["winningPlan"])
+
+
+def check_query_plans(db) -> list[str]:
+    """
+    Run explain() on every production query and raise if any of them does a COLLSCAN,
+    or an in-memory SORT for the paged listings.
+    Returns the one-line plan summary of each query.
+    """
+    report = []
+    failures = []
+    for collection, query, sort in production_queries():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = winning_plan_stages(cursor.explain())
+        line = f"{collection} {query}: {' <- '.join(stages)}"
+        report.append(line)
+        if "COLLSCAN" in stages or (sort and "SORT" in stages):
+            failures.append(line)
+
+    if failures:
+        raise RuntimeError("Collection scans found:\n" + "\n".join(failures))
+    return report
+
+
+if __name__ == "__main__":
+    from db.mongo_service import MongoService
+
+    parser = argparse.ArgumentParser(description="Ensure healthcare_db indexes and verify query plans")
+    parser.add_argument("--check", action="store_true", help="fail if any production query does a COLLSCAN or in-memory SORT")
+    args = parser.parse_args()
+
+    service = MongoService()
+    print("✅ Indexes ensured")
+    if args.check:
+        for line in check_query_plans(service.db):
+            print(line)
+        print("✅ No collection scans")
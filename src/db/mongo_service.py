@@ -1,16 +1,81 @@
 # mongo_service.py
+import hashlib
 import logging
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 import os
+import time
 from datetime import datetime, timedelta
 from bson import ObjectId
 import pytz
 
+from db.availability import find_free_slots
+from db.booking import insert_booking, slot_starts
+from db.indexes import ensure_indexes, phone_query
+from db.user_cache import UserCache
 from models.user import User
 
 load_dotenv(".env.local")
 
+DOCTOR_ID = "68fc65ca4916df00cfe6ec9d"
+
+
+def build_appointment(user_id: str, issue: str, datetime_iso: str, confirmation: str) -> dict:
+    """
+    Build the appointment document, with the doctor slots it reserves (see db/booking.py).
+    """
+    # Set your local timezone
+    local_tz = pytz.timezone("US/Pacific")
+
+    # Parse ISO string and localize to Pacific time
+    naive_dt = datetime.fromisoformat(datetime_iso)
+    start_time = local_tz.localize(naive_dt)
+    end_time = start_time + timedelta(hours=1)
+
+    # MongoDB stores in UTC automatically
+    return {
+        "user_id": user_id,
+        "doctor_id": DOCTOR_ID,
+        "issue": issue,
+        "start_datetime": start_time,
+        "end_datetime": end_time,
+        "slots": slot_starts(start_time, end_time),
+        "confirmation": confirmation,
+        "created_at": datetime.now(pytz.utc),
+    }
+
+
+def build_conversation(user_id: str, issue: str, symptoms: list[str], recommendations: list[str], appointment_id: str | None,
+                       idempotency_key: str | None = None) -> dict:
+    conversation = {
+        "user_id": user_id,
+        "issue": issue,
+        "symptoms": symptoms,
+        "recommendations": recommendations,
+        "appointment_id": appointment_id,
+        "created_at": datetime.now(),
+    }
+    if idempotency_key:
+        # Unique per call (see db/indexes.py), so saving the same call's summary twice keeps one.
+        # The _id is derived from it too, so every save of the same call carries the same id.
+        conversation["_id"] = ObjectId(hashlib.sha1(idempotency_key.encode()).digest()[:12])
+        conversation["idempotency_key"] = idempotency_key
+    return conversation
+
+
+def build_feedback(appointment_id, user_id: str, feedback: str, improved: bool, notes: str, timestamp: datetime) -> dict:
+    return {
+        # Stored as a string, like conversations.appointment_id
+        "appointment_id": str(appointment_id),
+        "user_id": user_id,
+        "feedback": feedback,
+        "improved": improved,
+        "notes": notes,
+        "created_at": timestamp,
+    }
+
+
 class MongoService:
     def __init__(self):
         logging.getLogger("pymongo").setLevel(logging.WARNING)
@@ -23,87 +88,65 @@ class MongoService:
         self.users = self.db["users"]
         self.calendar = self.db["calendars"]
         self.conversations = self.db["conversations"]
-        
+        self.feedback = self.db["feedback"]
+        self.user_cache = UserCache()
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the indexes behind the hot lookups (no-op when they already exist)."""
+        ensure_indexes(self.db)
+
     def fetch_user_by_id(self, user_id: str) -> User | None:
         """
-        Fetch a user document by its string _id and return a User instance.
+        Fetch a user by its string _id (through the user cache) and return a User instance.
         """
         try:
-            doc = self.users.find_one({"_id": ObjectId(user_id)})
-            if not doc:
-                print(f"⚠️ No user found with id: {user_id}")
-                return None
-            return User(
-                _id=str(doc["_id"]),
-                name=doc.get("name", ""),
-                phone=doc.get("phone", ""),
-                email=doc.get("email", ""),
-                user_type=doc.get("type", "patient"),
-            )
+            return self._cached_user("id", user_id, {"_id": ObjectId(user_id)})
         except Exception as e:
             print(f"Error fetching user: {e}")
             return None
         
     def fetch_user_by_phone(self, phone_number: str) -> User | None:
         """
-        Fetch a user document by phone number and return a User instance.
+        Fetch a user by phone number (through the user cache) and return a User instance.
         """
         try:
-            doc = self.users.find_one({"phone": phone_number})
-            if not doc:
-                print(f"⚠️ No user found with phone: {phone_number}")
-                return None
-            return User(
-                _id=str(doc["_id"]),
-                name=doc.get("name", ""),
-                phone=doc.get("phone", ""),
-                email=doc.get("email", ""),
-                user_type=doc.get("type", "patient"),
-            )
+            return self._cached_user("phone", phone_number, phone_query(phone_number))
         except Exception as e:
             print(f"Error fetching user by phone: {e}")
             return None
 
+    def _cached_user(self, field: str, value: str, query: dict) -> User | None:
+        found, user = self.user_cache.lookup(field, value)
+        if found:
+            return user
+
+        started = time.perf_counter()
+        doc = self.users.find_one(query, User.PROJECTION)
+        user = User.from_document(doc) if doc else None
+        self.user_cache.store(field, value, user, (time.perf_counter() - started) * 1000)
+        if not user:
+            print(f"⚠️ No user found with {field}: {value}")
+        return user
+
+    def invalidate_user(self, user_id: str | None = None, phone: str | None = None):
+        """Call after a users document is created, updated or deleted."""
+        self.user_cache.invalidate(user_id=user_id, phone=phone)
+
     def create_appointment(self, user_id: str, issue: str, datetime_iso: str, confirmation: str):
-        """Insert appointment record into MongoDB with 1-hour overlap protection and timezone-aware datetime."""
-        # Set your local timezone
-        local_tz = pytz.timezone("US/Pacific")
-
-        # Parse ISO string and localize to Pacific time
-        naive_dt = datetime.fromisoformat(datetime_iso)
-        start_time = local_tz.localize(naive_dt)
-        end_time = start_time + timedelta(hours=1)
-
-        doctor_id = "68fc65ca4916df00cfe6ec9d"
-
-        # Define protected window: ±55 minutes
-        window_start = start_time - timedelta(minutes=55)
-        window_end = start_time + timedelta(minutes=55)
-
-        # MongoDB stores in UTC automatically
-        conflict = self.calendar.find_one({
-            "doctor_id": doctor_id,
-            "start_datetime": {"$lte": window_end},
-            "end_datetime": {"$gte": window_start},
-        })
-
-        if conflict:
-            print(f"⚠️ Conflict detected: doctor already has an appointment at {conflict['start_datetime']}")
-            return None
+        """
+        Insert a 1-hour, timezone-aware appointment unless it overlaps one of the doctor's.
+        The overlap check is the insert itself, so concurrent bookings can't double-book.
+        """
+        appointment = build_appointment(user_id, issue, datetime_iso, confirmation)
+        appointment_id = insert_booking(self.calendar, appointment)
+        if appointment_id:
+            print(f"✅ Appointment created for {appointment['start_datetime']} (ID: {appointment_id})")
+        return appointment_id
 
-        appointment = {
-            "user_id": user_id,
-            "doctor_id": doctor_id,
-            "issue": issue,
-            "start_datetime": start_time,
-            "end_datetime": end_time,
-            "confirmation": confirmation,
-            "created_at": datetime.now(pytz.utc),
-        }
-
-        result = self.calendar.insert_one(appointment)
-        print(f"✅ Appointment created for {start_time} (ID: {result.inserted_id})")
-        return str(result.inserted_id)
+    def find_free_slots(self, start: datetime, end: datetime, limit: int | None = None) -> list[datetime]:
+        """Start times in [start, end) at which the doctor can still be booked (see db/availability.py)."""
+        return find_free_slots(self.calendar, DOCTOR_ID, start, end, limit)
 
     def get_appointments(self, user_id: str):
         """Fetch all appointments for a user."""
@@ -113,23 +156,27 @@ class MongoService:
         """Remove appointment if needed."""
         return self.calendar.delete_one({"_id": ObjectId(appointment_id)})
     
-    def save_conversation_summary(self, user_id: str, issue: str, symptoms: list[str], recommendations: list[str],appointment_id: str | None):
+    def save_conversation_summary(self, user_id: str, issue: str, symptoms: list[str], recommendations: list[str],appointment_id: str | None,
+                                  idempotency_key: str | None = None):
         """
-        Save summarized conversation after call ends.
+        Save summarized conversation after call ends. Saving again with the same
+        `idempotency_key` returns the summary already stored for it.
         """
-        conversation = {
-            "user_id": user_id,
-            "issue": issue,
-            "symptoms": symptoms,
-            "recommendations": recommendations,
-            "appointment_id": appointment_id,
-            "created_at": datetime.now(),
-        }
-
-        result = self.conversations.insert_one(conversation)
+        conversation = build_conversation(user_id, issue, symptoms, recommendations, appointment_id, idempotency_key)
+
+        try:
+            result = self.conversations.insert_one(conversation)
+        except DuplicateKeyError:
+            existing = self.conversations.find_one({"idempotency_key": idempotency_key}, {"_id": 1})
+            return str(existing["_id"])
         print(f"💾 Conversation saved (ID: {result.inserted_id})")
         return str(result.inserted_id)
     
+    def save_feedback(self, appointment_id, user_id: str, feedback: str, improved: bool, notes: str, timestamp: datetime):
+        """Save a patient's follow-up call feedback."""
+        result = self.feedback.insert_one(build_feedback(appointment_id, user_id, feedback, improved, notes, timestamp))
+        return str(result.inserted_id)
+
     def fetch_appointment_by_id(self, appointment_id: str):
         """Fetch appointment by its ID."""
         return self.calendar.find_one({"_id": ObjectId(appointment_id)})
\ No newline at end of file
@@ -0,0 +1,228 @@
+# queries.py
+# Aggregation pipelines behind the FastAPI read endpoints, shared with the benchmarks.
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from models.user import User
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Opaque cursor pointing just after `doc` in (sort_field, _id) order."""
+    position = {"t": doc[sort_field].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_filter(query: dict, sort_field: str, cursor: str | None = None,
+                start: datetime | None = None, end: datetime | None = None) -> dict:
+    """
+    Add the keyset condition for `cursor` and an optional [start, end] range on
+    `sort_field` to `query`. Pages are ordered by (sort_field, _id) ascending,
+    which the compound indexes in db/indexes.py serve without an in-memory sort.
+    """
+    conditions = [query]
+    if start or end:
+        date_range = {}
+        if start:
+            date_range["$gte"] = start
+        if end:
+            date_range["$lte"] = end
+        conditions.append({sort_field: date_range})
+    if cursor:
+        after, after_id = decode_cursor(cursor)
+        conditions.append({"$or": [
+            {sort_field: {"$gt": after}},
+            {sort_field: after, "_id": {"$gt": after_id}},
+        ]})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def page_sort(sort_field: str) -> list[tuple[str, int]]:
+    return [(sort_field, 1), ("_id", 1)]
+
+
+def split_page(docs: list[dict], limit: int, sort_field: str) -> tuple[list[dict], str | None]:
+    """Trim a `limit + 1` fetch to `limit` docs and the cursor of the next page (None on the last page)."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field)
+
+
+def doctor_calendar_pipeline(doctor_id: str, cursor: str | None = None, start: datetime | None = None,
+                             end: datetime | None = None, limit: int | None = None) -> list[dict]:
+    """
+    A doctor's appointments joined with the booking patient in one round-trip.
+    Only the fields the /calendar/doctor response uses are projected.
+    With `limit`, one extra appointment is fetched so the caller can tell whether a next page exists.
+    Appointments whose patient no longer exists are kept without a `user`, so they still
+    count towards the page and its cursor; drop them with with_patients() after split_page().
+    """
+    paging = [
+        {"$match": page_filter({"doctor_id": doctor_id}, "start_datetime", cursor, start, end)},
+        {"$sort": dict(page_sort("start_datetime"))},
+    ]
+    if limit:
+        paging.append({"$limit": limit + 1})
+
+    return paging + [
+        {"$lookup": {
+            "from": "users",
+            "let": {"user_oid": {"$convert": {"input": "$user_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$user_oid"]}}},
+                {"$project": User.PROJECTION},
+            ],
+            "as": "user",
+        }},
+        {"$unwind": {"path": "$user", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "user": 1,
+            "issue": 1,
+            "start_datetime": 1,
+            "end_datetime": 1,
+            "confirmation": 1,
+        }},
+    ]
+
+
+def with_patients(docs: list[dict]) -> list[dict]:
+    """doctor_calendar_pipeline documents whose patient still exists."""
+    return [doc for doc in docs if doc.get("user")]
+
+
+def doctor_appointment_response(doc: dict) -> dict:
+    """Format one doctor_calendar_pipeline document for the /calendar/doctor response."""
+    user = doc["user"] if isinstance(doc["user"], User) else User.from_document(doc["user"])
+    return {
+        "user": {
+            "id": user._id,
+            "name": user.name,
+            "phone": user.phone,
+            "email": user.email,
+        },
+        "details": {
+            "id": str(doc["_id"]),
+            "issue": doc["issue"],
+            "start_datetime": str(doc["start_datetime"]),
+            "end_datetime": str(doc["end_datetime"]),
+            "confirmation": doc["confirmation"],
+        },
+    }
+
+
+def user_conversations_pipeline(user_id: str, cursor: str | None = None, start: datetime | None = None,
+                                end: datetime | None = None, limit: int | None = None) -> list[dict]:
+    """
+    A user's conversations joined with their appointment in one round-trip.
+    appointment_id is stored as a string, so it is converted to an ObjectId for the join;
+    a missing or malformed id leaves the appointment null instead of failing the aggregation.
+    Paged on (created_at, _id) like doctor_calendar_pipeline.
+    """
+    paging = [
+        {"$match": page_filter({"user_id": user_id}, "created_at", cursor, start, end)},
+        {"$sort": dict(page_sort("created_at"))},
+    ]
+    if limit:
+        paging.append({"$limit": limit + 1})
+
+    return paging + [
+        {"$lookup": {
+            "from": "calendars",
+            "let": {"appointment_oid": {"$convert": {"input": "$appointment_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$appointment_oid"]}}},
+                {"$project": {
+                    "_id": 0,
+                    "doctor_id": 1,
+                    "issue": 1,
+                    "start_datetime": 1,
+                    "end_datetime": 1,
+                    "confirmation": 1,
+                    "created_at": 1,
+                }},
+            ],
+            "as": "appointment",
+        }},
+        {"$project": {
+            "issue": 1,
+            "symptoms": 1,
+            "recommendations": 1,
+            "created_at": 1,
+            "appointment": {"$first": "$appointment"},
+        }},
+    ]
+
+
+def conversation_response(conversation: dict, calendar: dict | None) -> dict:
+    """Format a conversation and its appointment (None when it no longer exists)."""
+    return {
+        "conversation": {
+            "detail": {
+                "appointment": {
+                    "doctor_id": calendar["doctor_id"],
+                    "issue": calendar["issue"],
+                    "start_datetime": str(calendar["start_datetime"]),
+                    "end_datetime": str(calendar["end_datetime"]),
+                    "confirmation": calendar["confirmation"],
+                    "created_at": str(calendar["created_at"])
+                } if calendar else None,
+                "ai_summary": {
+                    "issue": conversation["issue"],
+                    "symptoms": conversation["symptoms"],
+                    "recommendations": conversation["recommendations"]
+                }
+            }
+        }
+    }
+
+
+def follow_up_candidates_pipeline(start: datetime, end: datetime) -> list[dict]:
+    """
+    Appointments that ended in [start, end), have no feedback yet and whose patient
+    still exists, oldest first, as {appointment_id, user_id, phone}.
+    Feedback stores appointment_id as a string, so _id is stringified for the join.
+    """
+    return [
+        {"$match": {"end_datetime": {"$gte": start, "$lt": end}}},
+        {"$sort": {"end_datetime": 1, "_id": 1}},
+        {"$lookup": {
+            "from": "feedback",
+            "let": {"appointment_id": {"$toString": "$_id"}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$appointment_id", "$$appointment_id"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}},
+            ],
+            "as": "feedback",
+        }},
+        {"$match": {"feedback": {"$size": 0}}},
+        {"$lookup": {
+            "from": "users",
+            "let": {"user_oid": {"$convert": {"input": "$user_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$user_oid"]}}},
+                {"$project": {"_id": 0, "phone": 1}},
+            ],
+            "as": "user",
+        }},
+        {"$unwind": "$user"},
+        {"$project": {
+            "_id": 0,
+            "appointment_id": {"$toString": "$_id"},
+            "user_id": 1,
+            "phone": "$user.phone",
+        }},
+    ]
@@ -0,0 +1,157 @@
+# user_cache.py
+import json
+import os
+import sqlite3
+import time
+
+from models.user import User
+from utils.ttl_cache import TTLCache
+
+
+class SharedUserStore:
+    """
+    SQLite file of cached User profiles shared by every process on the host.
+    Each agent job runs in its own process, so an in-memory cache dies with the call;
+    this one is still there when the same patient calls back.
+    Entries are keyed "<field>:<value>", and a NULL user is a negative entry.
+    """
+    def __init__(self, path: str, max_size: int):
+        self.path = path
+        self.max_size = max_size
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        # WAL lets job processes read while another one writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS users (key TEXT PRIMARY KEY, user TEXT, expires_at REAL NOT NULL)")
+        self.writes = 0
+
+    def get(self, key: str) -> tuple[bool, User | None]:
+        row = self.conn.execute("SELECT user, expires_at FROM users WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None
+        return True, User(**json.loads(row[0])) if row[0] else None
+
+    def set(self, entries: dict[str, User | None], ttl_seconds: float):
+        expires_at = time.time() + ttl_seconds
+        rows = [(key, json.dumps(_fields(user)) if user else None, expires_at) for key, user in entries.items()]
+        self.conn.executemany("INSERT OR REPLACE INTO users (key, user, expires_at) VALUES (?, ?, ?)", rows)
+        self.writes += 1
+        # Expired entries are cleared, and the oldest dropped past max_size, every 100 writes
+        if self.writes % 100 == 0:
+            self.conn.execute("DELETE FROM users WHERE expires_at < ?", (time.time(),))
+            self.conn.execute(
+                "DELETE FROM users WHERE key IN (SELECT key FROM users ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def delete(self, keys: list[str]):
+        self.conn.executemany("DELETE FROM users WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self):
+        self.conn.execute("DELETE FROM users")
+
+
+def _fields(user: User) -> dict:
+    return {"_id": user._id, "name": user.name, "phone": user.phone, "email": user.email, "type": user.type}
+
+
+class UserCache:
+    """
+    Bounded TTL cache of User profiles, reachable by both id and phone.
+    Unknown phone numbers / ids are cached as negative entries with a shorter TTL,
+    so repeated calls from an unregistered number don't hit Mongo either.
+    Lookups go to a per-process TTLCache first, then to the SharedUserStore at
+    USER_CACHE_PATH (set it empty to keep the cache in memory only).
+    """
+    def __init__(self, max_size: int | None = None, ttl_seconds: float | None = None,
+                 negative_ttl_seconds: float | None = None, path: str | None = None):
+        max_size = max_size or int(os.getenv("USER_CACHE_SIZE", "10000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("USER_CACHE_TTL", "300"))
+        self.negative_ttl_seconds = negative_ttl_seconds or float(os.getenv("USER_CACHE_NEGATIVE_TTL", "60"))
+        self.users = TTLCache(max_size, self.ttl_seconds)
+        self.unknown = TTLCache(max_size, self.negative_ttl_seconds)
+        path = os.getenv("USER_CACHE_PATH", "user_cache.sqlite3") if path is None else path
+        self.shared = SharedUserStore(path, max_size) if path else None
+        self.shared_hits = 0
+        self.loads = 0
+        self.load_ms = 0.0
+
+    def lookup(self, field: str, value: str) -> tuple[bool, User | None]:
+        """(True, user) on a hit, (True, None) on a negative hit and (False, None) on a miss."""
+        user = self.users.get((field, value))
+        if user is not None:
+            return True, user
+        if self.unknown.get((field, value)) is not None:
+            return True, None
+        if self.shared is None:
+            return False, None
+
+        found, user = self.shared.get(f"{field}:{value}")
+        if found:
+            # Cached by an earlier call's process
+            self.shared_hits += 1
+            if user is None:
+                self.unknown.set((field, value), True)
+            else:
+                self._remember(user)
+        return found, user
+
+    def store(self, field: str, value: str, user: User | None, load_ms: float):
+        """Cache the result of a Mongo lookup that took `load_ms`."""
+        self.loads += 1
+        self.load_ms += load_ms
+        if user is None:
+            self.unknown.set((field, value), True)
+            if self.shared:
+                self.shared.set({f"{field}:{value}": None}, self.negative_ttl_seconds)
+            return
+        self._remember(user)
+        if self.shared:
+            keys = [f"id:{user._id}"] + ([f"phone:{user.phone}"] if user.phone else [])
+            self.shared.set(dict.fromkeys(keys, user), self.ttl_seconds)
+
+    def _remember(self, user: User):
+        self.users.set(("id", user._id), user)
+        if user.phone:
+            self.users.set(("phone", user.phone), user)
+        # A user that now exists is no longer unknown under either key
+        self.unknown.delete(("id", user._id))
+        self.unknown.delete(("phone", user.phone))
+
+    def invalidate(self, user_id: str | None = None, phone: str | None = None):
+        """Drop a user after its record changed (or was created) in Mongo."""
+        cached = self.users.peek(("id", user_id)) if user_id else None
+        if cached is None and user_id and self.shared:
+            cached = self.shared.get(f"id:{user_id}")[1]
+        if cached is not None and cached.phone:
+            phone = phone or cached.phone
+        keys = [key for key in (("id", user_id), ("phone", phone)) if key[1]]
+        for key in keys:
+            self.users.delete(key)
+            self.unknown.delete(key)
+        if self.shared:
+            self.shared.delete([f"{field}:{value}" for field, value in keys])
+
+    def clear(self):
+        self.users.clear()
+        self.unknown.clear()
+        if self.shared:
+            self.shared.clear()
+
+    def stats(self) -> dict:
+        users = self.users.stats()
+        unknown = self.unknown.stats()
+        # A shared-store hit first counts as an in-memory miss; count it once, as a hit
+        hits = users["hits"] + unknown["hits"] + self.shared_hits
+        avg_load_ms = self.load_ms / self.loads if self.loads else 0.0
+        return {
+            "size": users["size"],
+            "unknown_size": unknown["size"],
+            "hits": hits,
+            "shared_hits": self.shared_hits,
+            "negative_hits": unknown["hits"],
+            "misses": self.loads,
+            "hit_rate": hits / (hits + self.loads) if hits + self.loads else 0.0,
+            "avg_load_ms": avg_load_ms,
+            "ms_saved": hits * avg_load_ms,
+        }
@@ -2,22 +2,24 @@ import asyncio
 import json
 from datetime import datetime
 import random
+import pytz
 from dotenv import load_dotenv
 from livekit import agents, api
 from livekit.agents import AgentSession, Agent, RoomInputOptions
-from livekit.plugins import noise_cancellation, silero
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
+from livekit.plugins import noise_cancellation
 from livekit.rtc import ConnectionState
-from db.mongo_service import MongoService
+from campaigns.follow_up import SIP_TRUNK_IDS
+from db.async_mongo_service import AsyncMongoService
+from db.availability import LOCAL_TZ
+from utils.prewarm import prewarm_voice_models, timed
+from utils.room_utils import wait_for_participant
 from utils.time_utils import format_datetime_natural
 
 load_dotenv(".env.local")
 
-mongo_service = MongoService()
-
 # --- Feedback Agent --- #
 class FeedbackAgent(Agent):
-    def __init__(self, user, appointment):
+    def __init__(self, user, appointment, mongo_service: AsyncMongoService):
         self.user = user
         self.appointment = appointment
         self.feedback = None
@@ -28,9 +30,9 @@ class FeedbackAgent(Agent):
         async def record_feedback(ctx: agents.RunContext, feedback: str, improved: bool, notes: str = "") -> dict:
             """Store patient's feedback after follow-up call"""
             try:
-                mongo_service.save_feedback(
+                await mongo_service.save_feedback(
                     appointment_id=self.appointment["_id"],
-                    user_id=str(self.user["_id"]),
+                    user_id=self.user._id if self.user else "anonymous",
                     feedback=feedback,
                     improved=improved,
                     notes=notes,
@@ -57,19 +59,32 @@ class FeedbackAgent(Agent):
 
 
 # --- Entrypoint --- #
+def prewarm(proc: agents.JobProcess):
+    prewarm_voice_models(proc)
+    proc.userdata["mongo"] = timed("Mongo client", AsyncMongoService)
+
+
 async def entrypoint(ctx: agents.JobContext):
+    mongo_service = ctx.proc.userdata["mongo"]
+
+    # Open the Mongo pool while the room connects
+    mongo_warm = asyncio.create_task(mongo_service.warm())
     await ctx.connect()
+    await mongo_warm
     room = ctx.room
 
     # --- Step 1: Parse metadata for outbound call ---
     phone_number = None
     appointment = None
+    sip_trunk_id = SIP_TRUNK_IDS[0]
     try:
         if ctx.job.metadata:
             data = json.loads(ctx.job.metadata)
             print(f"Parsed metadata: {data}")
             phone_number = data.get("phone_number")
-            appointment = mongo_service.fetch_appointment_by_id(data.get("appointment_id"))
+            # Campaigns spread calls over several trunks
+            sip_trunk_id = data.get("sip_trunk_id", sip_trunk_id)
+            appointment = await mongo_service.fetch_appointment_by_id(data.get("appointment_id"))
     except Exception as e:
         print(f"Error parsing metadata: {e}")
 
@@ -83,7 +98,7 @@ async def entrypoint(ctx: agents.JobContext):
     try:
         await ctx.api.sip.create_sip_participant(api.CreateSIPParticipantRequest(
             room_name=ctx.room.name,
-            sip_trunk_id="ST_6xaaSRD7hsnH", 
+            sip_trunk_id=sip_trunk_id,
             sip_call_to=phone_number,
             participant_identity=phone_number,
             wait_until_answered=True,
@@ -95,12 +110,7 @@ async def entrypoint(ctx: agents.JobContext):
         return
 
     # --- Step 3: Wait for participant ---
-    participant = None
-    for _ in range(10):
-        if room.remote_participants:
-            participant = next(iter(room.remote_participants.values()))
-            break
-        await asyncio.sleep(1)
+    participant = await wait_for_participant(room, timeout=10)
 
     if not participant:
         print("⚠️ No participant joined the follow-up call.")
@@ -108,19 +118,20 @@ async def entrypoint(ctx: agents.JobContext):
 
     print(f"✅ Patient {participant.identity} joined the feedback call.")
 
-    user = mongo_service.fetch_user_by_phone(phone_number)
-    print(f"Fetched user: {user.name} ({user.email})")
+    user = await mongo_service.fetch_user_by_phone(phone_number)
+    if user:
+        print(f"Fetched user: {user.name} ({user.email})")
 
     # --- Step 4: Start AgentSession ---
     session = AgentSession(
         stt="assemblyai/universal-streaming:en",
         llm="openai/gpt-4.1-mini",
         tts="deepgram/nova-3-general",
-        vad=silero.VAD.load(),
-        turn_detection=MultilingualModel()
+        vad=ctx.proc.userdata["vad"],
+        turn_detection=ctx.proc.userdata["turn_detection"]
     )
 
-    agent = FeedbackAgent(user=user, appointment=appointment)
+    agent = FeedbackAgent(user=user, appointment=appointment, mongo_service=mongo_service)
 
     await session.start(
         room=ctx.room,
@@ -132,7 +143,7 @@ async def entrypoint(ctx: agents.JobContext):
 
     # Outbound call: let the agent start conversation
     await session.generate_reply(
-        instructions=f"Call the patient to check on their recovery after their visit on {format_datetime_natural(appointment['datetime'])}."
+        instructions=f"Call the patient to check on their recovery after their visit on {format_datetime_natural(pytz.utc.localize(appointment['start_datetime']).astimezone(LOCAL_TZ).isoformat())}."
     )
 
     # --- Step 5: Cleanup on disconnect ---
@@ -151,4 +162,4 @@ async def entrypoint(ctx: agents.JobContext):
     room.on("participant_disconnected", lambda p: asyncio.create_task(cleanup()))
 
 if __name__ == "__main__":
-    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, agent_name="my-telephony-agent"))
\ No newline at end of file
+    agents.cli.run_app(agents.WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm, agent_name="my-telephony-agent"))
\ No newline at end of file
@@ -1,27 +1,59 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from pymongo import AsyncMongoClient
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from bson import ObjectId
+from datetime import datetime, timedelta
+import json
+import asyncio
 import os
-import smtplib
-from email.message import EmailMessage
+
+from db.availability import APPOINTMENT_MINUTES, LOCAL_TZ, find_free_slots_async, localize
+from db.indexes import ensure_indexes_async
+from db.queries import (
+    conversation_response,
+    doctor_appointment_response,
+    doctor_calendar_pipeline,
+    page_filter,
+    page_sort,
+    split_page,
+    user_conversations_pipeline,
+    with_patients,
+)
+from models.user import User
+from notifications.notification_client import NotificationClient
 
 load_dotenv(".env.local")
 
+# Default and maximum page size of the calendar and conversation listings
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+# Appointments enriched per users query when streaming a doctor calendar export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "200"))
+# Default and longest window searched by /calendar/availability
+AVAILABILITY_DAYS = int(os.getenv("AVAILABILITY_DAYS", "7"))
+MAX_AVAILABILITY_DAYS = 31
+
 @asynccontextmanager
 async def lifespan(api: FastAPI):
     # Startup: Connect to MongoDB
     print("🚀 Connecting to MongoDB...")
     app.mongodb_client = AsyncMongoClient(os.environ["MONGODB_URL"])
-    app.db = app.mongodb_client.healthcare_db
+    app.db = app.mongodb_client[os.getenv("MONGODB_DB", "healthcare_db")]
+    await ensure_indexes_async(app.db)
     print("✅ MongoDB connected")
+
+    # Outbound email: pooled SMTP connections behind a background queue
+    app.notifications = NotificationClient(mode="local")
+    await app.notifications.start()
     
     yield  # App runs here
     
-    # Shutdown: Close MongoDB connection
+    # Shutdown: flush queued emails, then close MongoDB connection
+    print("📧 Flushing email queue...")
+    await app.notifications.close()
     print("🔌 Closing MongoDB connection...")
     await app.mongodb_client.close()
     print("👋 MongoDB disconnected")
@@ -62,12 +94,13 @@ class LoginModel(BaseModel):
 @app.post("/login")
 async def login(data: LoginModel):
     print("user: ", data.email)
-    user = await app.db.users.find_one({"email": data.email})
+    doc = await app.db.users.find_one({"email": data.email}, User.PROJECTION)
 
-    if user is not None:
+    if doc is not None:
+        user = User.from_document(doc)
         return JSONResponse(
             status_code=200,
-            content={"status": "ok", "id": str(user["_id"]), "type": user["type"]}
+            content={"status": "ok", "id": user._id, "type": user.type}
         )
 
     return JSONResponse(
@@ -75,9 +108,28 @@ async def login(data: LoginModel):
         content={"status": "failed"}
     )
 
+def invalid_cursor(error: ValueError) -> JSONResponse:
+    return JSONResponse(
+        status_code=400,
+        content={"status": "failed", "message": str(error)}
+    )
+
 @app.get("/calendar/user")
-async def user_calendar(id: str):
-    calendars = await app.db.calendars.find({"user_id": id}).to_list(length=None)
+async def user_calendar(
+    id: str,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = None,
+):
+    try:
+        query = page_filter({"user_id": id}, "start_datetime", cursor, from_, to)
+    except ValueError as e:
+        return invalid_cursor(e)
+
+    projection = {"issue": 1, "start_datetime": 1, "end_datetime": 1, "confirmation": 1}
+    calendars = await app.db.calendars.find(query, projection).sort(page_sort("start_datetime")).to_list(length=limit + 1)
+    calendars, next_cursor = split_page(calendars, limit, "start_datetime")
 
     return JSONResponse(
         status_code=200,
@@ -89,50 +141,103 @@ async def user_calendar(id: str):
                     "end_datetime": str(calendar["end_datetime"]),
                     "confirmation": calendar["confirmation"]
                 } for calendar in calendars
-            ]
+            ],
+            "next_cursor": next_cursor
         } if len (calendars) > 0 else []
     )
 
+async def stream_doctor_calendar(doctor_id: str, start: datetime | None, end: datetime | None):
+    """
+    Yield a doctor's appointments as NDJSON lines straight from the Mongo cursor.
+    Patients are fetched with one $in query per EXPORT_BATCH_SIZE appointments,
+    so memory stays flat however long the schedule is.
+    """
+    projection = {"user_id": 1, "issue": 1, "start_datetime": 1, "end_datetime": 1, "confirmation": 1}
+    calendars = app.db.calendars.find(
+        page_filter({"doctor_id": doctor_id}, "start_datetime", None, start, end), projection
+    ).sort(page_sort("start_datetime")).batch_size(EXPORT_BATCH_SIZE)
+
+    async def enriched(batch: list[dict]):
+        user_ids = {ObjectId(c["user_id"]) for c in batch if ObjectId.is_valid(c["user_id"])}
+        users = {
+            str(doc["_id"]): User.from_document(doc)
+            async for doc in app.db.users.find({"_id": {"$in": list(user_ids)}}, User.PROJECTION)
+        }
+        lines = []
+        for calendar in batch:
+            # Appointments whose patient no longer exists are left out, like the paged endpoint
+            user = users.get(calendar["user_id"])
+            if user:
+                lines.append(json.dumps(doctor_appointment_response({**calendar, "user": user})) + "\n")
+        return "".join(lines)
+
+    batch = []
+    async for calendar in calendars:
+        batch.append(calendar)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield await enriched(batch)
+            batch = []
+    if batch:
+        yield await enriched(batch)
+
 @app.get("/calendar/doctor")
-async def doctor_calendar(id: str):
-    calendars = await app.db.calendars.find({"doctor_id": id}).to_list(length=None)
-
-    if len(calendars) > 0:
-        # Format data
-        appointments = []
-        for calendar in calendars:
-            user = await app.db.users.find_one({"_id": ObjectId(calendar["user_id"])})
-            print(user)
-            
-            appointments.append({
-                "user": {
-                    "id": str(user["_id"]),
-                    "name": user["name"],
-                    "phone": user["phone"],
-                    "email": user["email"],
-                },
-                "details": {
-                    "id": str(calendar["_id"]),
-                    "issue": calendar["issue"],
-                    "start_datetime": str(calendar["start_datetime"]),
-                    "end_datetime": str(calendar["end_datetime"]),
-                    "confirmation": calendar["confirmation"],
-                },
-            })
+async def doctor_calendar(
+    request: Request,
+    id: str,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = None,
+    stream: bool = False,
+):
+    # Full export as NDJSON: ?stream=true or Accept: application/x-ndjson
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(stream_doctor_calendar(id, from_, to), media_type="application/x-ndjson")
+
+    try:
+        pipeline = doctor_calendar_pipeline(id, cursor, from_, to, limit)
+    except ValueError as e:
+        return invalid_cursor(e)
+
+    # Appointments and their patients in one aggregation instead of one users lookup per appointment
+    results = await app.db.calendars.aggregate(pipeline)
+    calendars, next_cursor = split_page(await results.to_list(length=None), limit, "start_datetime")
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            # Appointments whose patient no longer exists are left out; the cursor still moves past them
+            "appointments": [doctor_appointment_response(doc) for doc in with_patients(calendars)],
+            "next_cursor": next_cursor
+        }
+    )
 
-        # Return data
+@app.get("/calendar/availability")
+async def doctor_availability(
+    id: str,
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+):
+    # Naive from/to are clinic-local times; the default window is the coming week
+    start = localize(from_) if from_ else datetime.now(LOCAL_TZ)
+    end = localize(to) if to else start + timedelta(days=AVAILABILITY_DAYS)
+    if not start < end <= start + timedelta(days=MAX_AVAILABILITY_DAYS):
         return JSONResponse(
-            status_code=200,
-            content={
-                "appointments": appointments
-            }
+            status_code=400,
+            content={"status": "failed", "message": f"to must be after from and at most {MAX_AVAILABILITY_DAYS} days later"}
         )
 
-    # Return empty appointments
+    slots = await find_free_slots_async(app.db.calendars, id, start, end, limit)
     return JSONResponse(
         status_code=200,
         content={
-            "appointments": []
+            "slots": [
+                {
+                    "start_datetime": slot.isoformat(),
+                    "end_datetime": (slot + timedelta(minutes=APPOINTMENT_MINUTES)).isoformat()
+                } for slot in slots
+            ]
         }
     )
 
@@ -146,75 +251,62 @@ class EmailModel(BaseModel):
 
 @app.post("/email")
 async def email(data: EmailModel):
+    # Delivery happens on the background queue; 202 means the message was accepted
     try:
-        msg = EmailMessage()
-        msg.set_content(data.content)
-        msg["Subject"] = data.subject
-        msg["From"] = os.environ["EMAIL"]
-        msg["To"] = data.email
-
-        server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
-        server.login(os.environ["EMAIL"], os.environ["EMAIL_PASSWORD"])
-        server.send_message(msg)
-        server.quit()
-
-        # Return success
+        message_id = await app.notifications.send_email(data.email, data.subject, data.content)
+    except asyncio.QueueFull:
         return JSONResponse(
-            status_code=200,
+            status_code=503,
             content={
-                "status": "ok"
+                "status": "failed",
+                "message": "Email queue is full"
             }
         )
-    except Exception as e:
-        print("error: ", e)
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "queued",
+            "id": message_id
+        }
+    )
+
+@app.get("/email/stats")
+async def email_stats():
+    return JSONResponse(app.notifications.stats())
+
+@app.get("/email/{message_id}")
+async def email_status(message_id: str):
+    status = app.notifications.status(message_id)
+    if status is None:
         return JSONResponse(
-            status_code=500,
-            content={
-                "status": "failed"
-            }
+            status_code=404,
+            content={"status": "failed", "message": "Unknown email id"}
         )
-    
+    return JSONResponse({"id": message_id, "status": status})
+
 @app.get("/conversations/user")
-async def conversation_user(id: str):
-    conversations = await app.db.conversations.find({"user_id": id}).to_list(length=None)
-
-    if conversations is not None:
-        data = []
-        for conversation in conversations:
-            calendar = await app.db.calendars.find_one({"_id": ObjectId(conversation["appointment_id"])})
-            data.append({
-                "conversation": {
-                    "detail": {
-                        "appointment": {
-                            "doctor_id": calendar["doctor_id"],
-                            "issue": calendar["issue"],
-                            "start_datetime": str(calendar["start_datetime"]),
-                            "end_datetime": str(calendar["end_datetime"]),
-                            "confirmation": calendar["confirmation"],
-                            "created_at": str(calendar["created_at"])
-                        },
-                        "ai_summary": {
-                            "issue": conversation["issue"],
-                            "symptoms": conversation["symptoms"],
-                            "recommendations": conversation["recommendations"]
-                        }
-                    }
-                }
-            })
-        
-        return JSONResponse(
-            status_code=200,
-            content={
-                "conversations": data
-            }
-        )
+async def conversation_user(
+    id: str,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = None,
+):
+    try:
+        pipeline = user_conversations_pipeline(id, cursor, from_, to, limit)
+    except ValueError as e:
+        return invalid_cursor(e)
 
+    # Conversations and their appointments in one aggregation instead of one calendars lookup each
+    results = await app.db.conversations.aggregate(pipeline)
+    conversations, next_cursor = split_page(await results.to_list(length=None), limit, "created_at")
 
-    
     return JSONResponse(
         status_code=200,
         content={
-            "conversations": None
+            "conversations": [conversation_response(doc, doc.get("appointment")) for doc in conversations],
+            "next_cursor": next_cursor
         }
     )
 
@@ -226,25 +318,7 @@ async def conversations(appointment_id: str):
         calendar = await app.db.calendars.find_one({"_id": ObjectId(appointment_id)})
         return JSONResponse(
             status_code=200,
-            content={
-                "conversation": {
-                    "detail": {
-                        "appointment": {
-                            "doctor_id": calendar["doctor_id"],
-                            "issue": calendar["issue"],
-                            "start_datetime": str(calendar["start_datetime"]),
-                            "end_datetime": str(calendar["end_datetime"]),
-                            "confirmation": calendar["confirmation"],
-                            "created_at": str(calendar["created_at"])
-                        },
-                        "ai_summary": {
-                            "issue": conversation["issue"],
-                            "symptoms": conversation["symptoms"],
-                            "recommendations": conversation["recommendations"]
-                        }
-                    }
-                }
-            }
+            content=conversation_response(conversation, calendar)
         )
 
     return JSONResponse(
@@ -252,4 +326,4 @@ async def conversations(appointment_id: str):
         content={
             "conversations": None
         }
-    )
\ No newline at end of file
+    )
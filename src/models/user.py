@@ -1,10 +1,22 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True, repr=False)
 class User:
-    def __init__(self, _id: str, name: str, phone: str, email: str, user_type: str):
-        self._id = _id
-        self.name = name
-        self.phone = phone
-        self.email = email
-        self.type = user_type
+    """Immutable, slotted user record built from a users document."""
+    _id: str
+    name: str
+    phone: str
+    email: str
+    type: str = "patient"
+
+    # The only users fields the services read; pass as the find projection
+    PROJECTION = {"name": 1, "phone": 1, "email": 1, "type": 1}
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "User":
+        get = doc.get
+        return cls(str(doc["_id"]), get("name", ""), get("phone", ""), get("email", ""), get("type", "patient"))
 
     def __repr__(self):
-        return f"User(name={self.name!r}, email={self.email!r}, type={self.type!r})"
\ No newline at end of file
+        return f"User(name={self.name!r}, email={self.email!r}, type={self.type!r})"
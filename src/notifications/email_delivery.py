@@ -0,0 +1,200 @@
+# email_delivery.py
+import asyncio
+import os
+import smtplib
+import time
+import uuid
+from collections import OrderedDict
+from email.message import EmailMessage
+
+from dotenv import load_dotenv
+
+load_dotenv(".env.local")
+
+# Delivery statuses kept for lookup, oldest dropped first
+MAX_TRACKED_MESSAGES = 10000
+
+
+def track_status(statuses: OrderedDict, message_id: str, status: str):
+    statuses[message_id] = status
+    statuses.move_to_end(message_id)
+    while len(statuses) > MAX_TRACKED_MESSAGES:
+        statuses.popitem(last=False)
+
+
+class SMTPConnection:
+    """
+    One long-lived SMTP session, opened (TLS handshake + login) on first use and
+    reused for every following message until the server drops it.
+    Blocking smtplib calls are meant to run in a worker thread.
+    """
+    def __init__(self, host: str, port: int, use_ssl: bool, username: str | None, password: str | None):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.server = None
+
+    def send(self, msg: EmailMessage):
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Idle connections get closed server side, reconnect once
+            self._connect()
+            self.server.send_message(msg)
+
+    def _connect(self):
+        self.close()
+        if self.use_ssl:
+            self.server = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            self.server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.username and self.password:
+            self.server.login(self.username, self.password)
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.server = None
+
+
+class EmailDeliveryQueue:
+    """
+    In-process bounded queue of outgoing emails drained by worker tasks.
+    Each worker owns one pooled SMTPConnection, and failed sends are retried with
+    exponential backoff before being counted as failed.
+    """
+    def __init__(self, host: str | None = None, port: int | None = None, use_ssl: bool | None = None,
+                 sender: str | None = None, password: str | None = None, workers: int | None = None,
+                 max_queue_size: int | None = None, max_attempts: int | None = None, backoff_seconds: float = 0.5):
+        self.host = host or os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.port = port or int(os.getenv("SMTP_PORT", "465"))
+        self.use_ssl = use_ssl if use_ssl is not None else os.getenv("SMTP_USE_SSL", "true").lower() == "true"
+        self.sender = sender or os.getenv("EMAIL")
+        self.password = password if password is not None else os.getenv("EMAIL_PASSWORD")
+        self.n_workers = workers or int(os.getenv("EMAIL_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))
+        self.backoff_seconds = backoff_seconds
+
+        self.queue = asyncio.Queue(maxsize=max_queue_size or int(os.getenv("EMAIL_QUEUE_SIZE", "1000")))
+        self.connections = []
+        self.workers = []
+        self.statuses = OrderedDict()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for _ in range(self.n_workers):
+            connection = SMTPConnection(self.host, self.port, self.use_ssl, self.sender, self.password)
+            self.connections.append(connection)
+            self.workers.append(asyncio.create_task(self._work(connection)))
+
+    async def stop(self, timeout: float = 10):
+        """Let queued emails go out (up to `timeout` seconds), then stop workers and close connections."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Email queue stopped with {self.queue.qsize()} messages undelivered")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        for connection in self.connections:
+            await asyncio.to_thread(connection.close)
+        self.workers = []
+        self.connections = []
+
+    def enqueue(self, to: str, subject: str, content: str) -> str:
+        """
+        Queue an email and return its id. Raises asyncio.QueueFull when the queue is at capacity.
+        """
+        msg = EmailMessage()
+        msg.set_content(content)
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = to
+
+        message_id = uuid.uuid4().hex
+        self.queue.put_nowait((message_id, msg))
+        track_status(self.statuses, message_id, "queued")
+        return message_id
+
+    def status(self, message_id: str) -> str | None:
+        """queued, sent or failed; None for unknown (or long forgotten) ids."""
+        return self.statuses.get(message_id)
+
+    async def _work(self, connection: SMTPConnection):
+        while True:
+            message_id, msg = await self.queue.get()
+            try:
+                await self._deliver(connection, message_id, msg)
+            except Exception as e:
+                # Anything unexpected fails this message only; the worker keeps serving the queue
+                print(f"❌ Email {message_id} to {msg['To']} failed: {e!r}")
+                self.failed += 1
+                track_status(self.statuses, message_id, "failed")
+                await asyncio.to_thread(connection.close)
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, connection: SMTPConnection, message_id: str, msg: EmailMessage) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await asyncio.to_thread(connection.send, msg)
+                self.sent += 1
+                track_status(self.statuses, message_id, "sent")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                # Drop the session so the next attempt starts from a fresh connection
+                await asyncio.to_thread(connection.close)
+                if attempt == self.max_attempts:
+                    print(f"❌ Email {message_id} to {msg['To']} failed after {attempt} attempts: {e}")
+                    self.failed += 1
+                    track_status(self.statuses, message_id, "failed")
+                    return False
+                self.retried += 1
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "messages_per_sec": self.sent / elapsed if elapsed else 0.0,
+        }
+
+
+# For testing purposes: deliver to a local aiosmtpd stand-in and report throughput
+if __name__ == "__main__":
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+
+    async def run(n_messages=500):
+        controller = Controller(Sink(), hostname="127.0.0.1", port=8025)
+        controller.start()
+        delivery = EmailDeliveryQueue(host="127.0.0.1", port=8025, use_ssl=False, sender="cura@example.com", password="")
+        delivery.start()
+
+        started = time.perf_counter()
+        for i in range(n_messages):
+            delivery.enqueue(f"patient{i}@example.com", "Cura Appointment Confirmation", "See you soon!")
+        await delivery.queue.join()
+        elapsed = time.perf_counter() - started
+
+        print(f"📧 {delivery.sent} messages in {elapsed:.2f}s — {delivery.sent / elapsed:.0f} messages/sec")
+        await delivery.stop()
+        controller.stop()
+
+    asyncio.run(run())
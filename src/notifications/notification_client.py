@@ -0,0 +1,99 @@
+# notification_client.py
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+
+import aiohttp
+from dotenv import load_dotenv
+
+from notifications.email_delivery import EmailDeliveryQueue, track_status
+
+load_dotenv(".env.local")
+
+
+class NotificationClient:
+    """
+    Single entry point for patient emails, shared by the API and the voice agents.
+    NOTIFICATION_MODE picks the transport:
+      local - hand messages straight to an in-process EmailDeliveryQueue (default)
+      http  - POST them to the API's /email endpoint over one pooled keep-alive session,
+              for deployments where the agents can't hold the SMTP credentials
+    send_email never waits for delivery; its id can be looked up with status().
+    """
+    def __init__(self, mode: str | None = None, url: str | None = None, max_concurrency: int | None = None,
+                 delivery: EmailDeliveryQueue | None = None):
+        self.mode = mode or os.getenv("NOTIFICATION_MODE", "local")
+        if self.mode not in ("local", "http"):
+            raise ValueError(f"Unknown NOTIFICATION_MODE: {self.mode}")
+        self.url = url or os.getenv("NOTIFICATION_URL", "https://healthcare-ai-backend-s5rf.onrender.com/email")
+        self.max_concurrency = max_concurrency or int(os.getenv("NOTIFICATION_MAX_CONCURRENCY", "10"))
+
+        self.delivery = delivery
+        self.session = None
+        self.semaphore = None
+        self.pending = set()
+        self.statuses = OrderedDict()
+
+    async def start(self):
+        """Open the transport. Called lazily by send_email, or up front to warm it."""
+        if self.mode == "local":
+            if self.delivery is None:
+                self.delivery = EmailDeliveryQueue()
+            if not self.delivery.workers:
+                self.delivery.start()
+        elif self.session is None or self.session.closed:
+            # Sockets are capped and kept alive, so a burst of bookings reuses a few connections
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        """Wait for in-flight emails, then release the transport."""
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        if self.delivery is not None:
+            await self.delivery.stop()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def send_email(self, to: str, subject: str, content: str) -> str:
+        """
+        Hand off an email and return its tracking id.
+        Raises asyncio.QueueFull when the local delivery queue is at capacity.
+        """
+        await self.start()
+        if self.mode == "local":
+            return self.delivery.enqueue(to, subject, content)
+
+        message_id = uuid.uuid4().hex
+        track_status(self.statuses, message_id, "queued")
+        task = asyncio.create_task(self._post(message_id, {"email": to, "subject": subject, "content": content}))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return message_id
+
+    async def _post(self, message_id: str, payload: dict):
+        async with self.semaphore:
+            try:
+                async with self.session.post(self.url, json=payload) as response:
+                    accepted = response.status < 300
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Failed to send email to {payload['email']}: {e}")
+                accepted = False
+        track_status(self.statuses, message_id, "sent" if accepted else "failed")
+
+    def status(self, message_id: str) -> str | None:
+        """queued, sent or failed; None for unknown ids."""
+        if self.mode == "local":
+            return self.delivery.status(message_id) if self.delivery else None
+        return self.statuses.get(message_id)
+
+    def stats(self) -> dict:
+        if self.mode == "local":
+            return self.delivery.stats() if self.delivery else {}
+        counts = {"queued": 0, "sent": 0, "failed": 0}
+        for status in self.statuses.values():
+            counts[status] += 1
+        return {**counts, "in_flight": len(self.pending)}
@@ -1,25 +1,69 @@
+import argparse
 import asyncio
 import json
-import random
+from datetime import date
 from livekit import api
 from dotenv import load_dotenv
 
+from campaigns.follow_up import FOLLOW_UP_AGENT, SIP_TRUNK_IDS, FollowUpDispatcher, follow_up_candidates, follow_up_window
+from db.async_mongo_service import AsyncMongoService
+
 load_dotenv(".env.local")
 
-async def trigger_feedback_call(phone_number: str, appointment_id: str):
-    print(f"Triggering feedback call to {phone_number} for appointment {appointment_id}...")
-    room_name = f"outbound-{''.join(str(random.randint(0,9)) for _ in range(10))}"
-    metadata = json.dumps({"phone_number": phone_number, "appointment_id": appointment_id})
 
-    async with api.LiveKitAPI() as lk:
+def livekit_dispatch(lk: api.LiveKitAPI):
+    """create_dispatch of one shared LiveKitAPI client, in the form FollowUpDispatcher calls."""
+    async def dispatch(room: str, metadata: str):
         await lk.agent_dispatch.create_dispatch(
             api.CreateAgentDispatchRequest(
-                agent_name="my-telephony-agent",
-                room=room_name,
+                agent_name=FOLLOW_UP_AGENT,
+                room=room,
                 metadata=metadata
             )
         )
+    return dispatch
+
+
+async def trigger_feedback_call(phone_number: str, appointment_id: str):
+    print(f"Triggering feedback call to {phone_number} for appointment {appointment_id}...")
+    metadata = json.dumps({"phone_number": phone_number, "appointment_id": appointment_id, "sip_trunk_id": SIP_TRUNK_IDS[0]})
+
+    async with api.LiveKitAPI() as lk:
+        await livekit_dispatch(lk)(f"follow-up-{appointment_id}", metadata)
     print("✅ Dispatch created successfully.")
 
+
+async def run_campaign(days_after: int | None, day: date | None, checkpoint_path: str, max_concurrency: int | None, calls_per_second: float | None):
+    start, end = follow_up_window(days_after, day=day)
+    print(f"📞 Following up on appointments that ended between {start} and {end}...")
+    mongo_service = AsyncMongoService()
+
+    async with api.LiveKitAPI() as lk:
+        dispatcher = FollowUpDispatcher(
+            livekit_dispatch(lk),
+            max_concurrency=max_concurrency,
+            calls_per_second=calls_per_second,
+            checkpoint_path=checkpoint_path,
+        )
+        stats = await dispatcher.run(follow_up_candidates(mongo_service.db, start, end), (start, end))
+
+    await mongo_service.close()
+    print(f"✅ {stats['dispatched']} calls dispatched ({stats['dispatches_per_sec']:.1f}/sec), "
+          f"{stats['duplicates']} duplicate patients skipped, {stats['resumed']} already called, {stats['failed']} failed")
+
+
 if __name__ == "__main__":
-    asyncio.run(trigger_feedback_call("+12096841862", "68fe1148af65e089f32fe5f5"))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Dispatch feedback follow-up calls")
+    parser.add_argument("--phone", help="call a single patient instead of running the campaign")
+    parser.add_argument("--appointment", help="appointment id of the single call")
+    parser.add_argument("--days-after", type=int, help="follow up on appointments that ended this many days ago")
+    parser.add_argument("--day", type=date.fromisoformat, help="follow up on appointments of this day (YYYY-MM-DD) instead")
+    parser.add_argument("--checkpoint", default="follow_up_checkpoint.json", help="progress file; rerun to resume")
+    parser.add_argument("--concurrency", type=int, help="dispatches in flight at once")
+    parser.add_argument("--calls-per-second", type=float, help="call rate per SIP trunk")
+    args = parser.parse_args()
+
+    if args.phone:
+        asyncio.run(trigger_feedback_call(args.phone, args.appointment))
+    else:
+        asyncio.run(run_campaign(args.days_after, args.day, args.checkpoint, args.concurrency, args.calls_per_second))
@@ -0,0 +1,19 @@
+import time
+
+from livekit.agents import JobProcess
+from livekit.plugins import silero
+from livekit.plugins.turn_detector.multilingual import MultilingualModel
+
+
+def timed(label: str, load):
+    """Run `load()` and log how long it took."""
+    started = time.perf_counter()
+    value = load()
+    print(f"⏱️ Prewarm {label}: {(time.perf_counter() - started) * 1000:.0f} ms")
+    return value
+
+
+def prewarm_voice_models(proc: JobProcess):
+    """Load the VAD and turn-detection models once per worker process."""
+    proc.userdata["vad"] = timed("VAD", silero.VAD.load)
+    proc.userdata["turn_detection"] = timed("turn detector", MultilingualModel)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+
+async def wait_for_participant(room, timeout: float):
+    """
+    Return the first remote participant of `room`, waiting up to `timeout` seconds
+    for its participant_connected event. Returns None on timeout.
+    """
+    if room.remote_participants:
+        return next(iter(room.remote_participants.values()))
+
+    joined = asyncio.get_running_loop().create_future()
+
+    def on_participant_connected(participant):
+        if not joined.done():
+            joined.set_result(participant)
+
+    room.on("participant_connected", on_participant_connected)
+    try:
+        # Someone may have joined between the first check and registering the handler
+        if room.remote_participants:
+            return next(iter(room.remote_participants.values()))
+        return await asyncio.wait_for(joined, timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        room.off("participant_connected", on_participant_connected)
+
+
+# For testing purposes: join latency of the old 1s polling loop vs the event-driven wait
+if __name__ == "__main__":
+    class FakeParticipant:
+        identity = "sip_+10000000000"
+
+    class FakeRoom:
+        def __init__(self):
+            self.remote_participants = {}
+            self.handlers = {}
+
+        def on(self, event, handler):
+            self.handlers.setdefault(event, []).append(handler)
+
+        def off(self, event, handler):
+            self.handlers[event].remove(handler)
+
+        def join(self):
+            participant = FakeParticipant()
+            self.remote_participants[participant.identity] = participant
+            self.joined_at = time.perf_counter()
+            for handler in list(self.handlers.get("participant_connected", [])):
+                handler(participant)
+
+    async def poll(room, attempts):
+        for _ in range(attempts):
+            if room.remote_participants:
+                return next(iter(room.remote_participants.values()))
+            await asyncio.sleep(1)
+
+    async def join_latency(wait, join_after=0.05):
+        room = FakeRoom()
+        asyncio.get_running_loop().call_later(join_after, room.join)
+        await wait(room)
+        return (time.perf_counter() - room.joined_at) * 1000
+
+    async def compare():
+        polling = await join_latency(lambda room: poll(room, 15))
+        event = await join_latency(lambda room: wait_for_participant(room, 15))
+        print(f"⏱️ Join to greeting: polling {polling:.1f} ms, event-driven {event:.1f} ms")
+
+    asyncio.run(compare())
@@ -0,0 +1,40 @@
+import time
+
+
+class PhaseTimer:
+    """
+    Wall-clock duration of the named startup phases of one call.
+    Phases measured with `measure` may overlap; `total` is time since creation.
+    """
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        self.open_phases = {}
+        self.phases = {}
+
+    def begin(self, phase: str):
+        """Start timing `phase`; `end` records it."""
+        self.open_phases[phase] = time.perf_counter()
+
+    def end(self, phase: str):
+        """Record the time since `begin(phase)` as `phase`."""
+        self.phases[phase] = (time.perf_counter() - self.open_phases.pop(phase)) * 1000
+
+    def checkpoint(self, name: str):
+        """Record the time since the timer was created as `name`."""
+        self.phases[name] = self.total()
+
+    async def measure(self, phase: str, awaitable):
+        """Await `awaitable` and record how long it took as `phase`."""
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.phases[phase] = (time.perf_counter() - started) * 1000
+
+    def total(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{phase} {ms:.0f} ms" for phase, ms in self.phases.items())
+        return f"⏱️ {self.label}: {phases}, total {self.total():.0f} ms"